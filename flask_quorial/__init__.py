@@ -1,6 +1,7 @@
 # - contains application factory
 # - tells Python that the flaskr/ directory is a package
 import os
+import tempfile
 from flask import Flask
 from werkzeug.middleware.proxy_fix import ProxyFix
 
@@ -10,6 +11,11 @@ def create_app(test_config=None):
     # instance_relative_config=True tells app that config files are relative to instance folder
     app = Flask(__name__, instance_relative_config=True)
 
+    # encode JSON responses with orjson when it is installed
+    from .json_provider import OrjsonProvider, orjson
+    if orjson is not None:
+        app.json = OrjsonProvider(app)
+
     #flask behind a proxy:
     # https://flask.palletsprojects.com/en/2.2.x/deploying/proxy_fix/?highlight=reverse%20proxy
     app.wsgi_app = ProxyFix(
@@ -22,6 +28,10 @@ def create_app(test_config=None):
             SECRET_KEY='dev',
             # path of sqlite database file
             DATABASE=os.path.join(app.instance_path,'flaskauu.sqlite'),
+            # idle SQLite connections kept for reuse (roughly the number of worker threads)
+            DB_POOL_SIZE=int(os.environ.get('DB_POOL_SIZE', 8)),
+            # rendered chat PDFs, used when no Redis cache is configured
+            PDF_CACHE_DIR=os.path.join(tempfile.gettempdir(), 'quorial_pdf_cache'),
     )
     # flush needed as stdout is BUFFERED
     print('Database created...', flush=True)
@@ -1,41 +1,382 @@
 # Chat functionality for Flask application
 
+import functools
+import glob
+import hashlib
+import json
+import multiprocessing
 import os
+import re
+import shutil
 import sys
-from io import BytesIO
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO, StringIO
+from tempfile import SpooledTemporaryFile
+from typing import Final
 from xml.sax.saxutils import escape
-from flask import (Blueprint, g, render_template, request, jsonify, send_file)
-from flask_quorial.db import get_db
+from flask import (Blueprint, Response, current_app, g, render_template, request, jsonify, send_file,
+                   stream_with_context)
+from flask_quorial.db import close_db, get_db
 from flask_quorial.auth import login_required
+from flask_quorial import rag_cache
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_LEFT, TA_RIGHT
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
-from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
+from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Spacer
 
-# Add the src directory to Python path for imports
-src_path = os.path.join(os.path.dirname(__file__), '..', 'src')
-if src_path not in sys.path:
-    sys.path.insert(0, src_path)
+# Redis is optional: without it (or without REDIS_URL) answers are not cached
+try:
+    import redis
+except ImportError:
+    redis = None
 
-# Import the full RAG pipeline
+# RQ is optional: with it, RAG_QUEUE=rq and REDIS_URL, send_message answers in an RQ worker
 try:
-    from src.rag_pipeline import complete_rag_pipeline
+    from rq import Queue
+    from rq.exceptions import NoSuchJobError
+    from rq.job import Job
 except ImportError:
-    def complete_rag_pipeline(*_args, **_kwargs):  # type: ignore
-        raise RuntimeError(
-            "RAG pipeline is not available. Verify that src/ is on the PYTHONPATH."
-        )
+    Queue = None
+
+# pypdf is optional: without it long sessions are rendered in a single pass
+try:
+    from pypdf import PdfWriter
+except ImportError:
+    PdfWriter = None
 
 bp = Blueprint('chat', __name__, url_prefix='/chat')
 
+# Longest title accepted when creating or renaming a session
+SESSION_TITLE_MAX_LENGTH = 200
+
+# Messages returned per page by get_session (default and upper bound for ?limit=)
+MESSAGES_PAGE_SIZE = 50
+MESSAGES_PAGE_MAX = 200
+
+# Largest SQLite rowid; the default before_id, so the first page is the newest one
+SQLITE_MAX_ROWID = 2**63 - 1
+
+# Statements on the message hot path, defined once and reused verbatim so the
+# connection's statement cache always hits
+SQL_SESSION_MESSAGE_COUNT: Final = (
+    'SELECT message_count FROM chat_sessions WHERE id = ? AND user_id = ?'
+)
+SQL_INSERT_MESSAGE: Final = (
+    'INSERT INTO chat_messages (session_id, message, is_user) VALUES (?, ?, ?)'
+)
+SQL_INSERT_PENDING_ANSWER: Final = (
+    "INSERT INTO chat_messages (session_id, message, is_user, status) VALUES (?, '', 0, 'pending')"
+)
+SQL_FILL_ANSWER: Final = "UPDATE chat_messages SET message = ?, status = 'done' WHERE id = ?"
+SQL_FAIL_ANSWER: Final = "UPDATE chat_messages SET message = ?, status = 'error' WHERE id = ?"
+SQL_OWNED_MESSAGE: Final = (
+    'SELECT m.message, m.status FROM chat_messages m '
+    'JOIN chat_sessions s ON s.id = m.session_id '
+    'WHERE m.id = ? AND m.session_id = ? AND s.user_id = ?'
+)
+SQL_MESSAGE_STATUS: Final = 'SELECT message, status FROM chat_messages WHERE id = ?'
+SQL_TOUCH_SESSION: Final = (
+    'UPDATE chat_sessions SET title = COALESCE(?, title), message_count = message_count + ?, '
+    'updated_at = CURRENT_TIMESTAMP WHERE id = ?'
+)
+# The LEFT JOIN folds the ownership check in: no row at all means no such session
+# (for this user), a single all-NULL message row means an empty page
+SQL_SESSION_MESSAGES_PAGE: Final = (
+    'SELECT m.id, m.message, m.is_user, m.status, m.timestamp FROM chat_sessions s '
+    'LEFT JOIN chat_messages m ON m.session_id = s.id AND m.id > ? '
+    'WHERE s.id = ? AND s.user_id = ? ORDER BY m.id ASC LIMIT ?'
+)
+SQL_SESSION_MESSAGES_PAGE_BEFORE: Final = (
+    'SELECT m.id, m.message, m.is_user, m.status, m.timestamp FROM chat_sessions s '
+    'LEFT JOIN chat_messages m ON m.session_id = s.id AND m.id < ? '
+    'WHERE s.id = ? AND s.user_id = ? ORDER BY m.id DESC LIMIT ?'
+)
+SQL_EXPORT_MESSAGES: Final = (
+    'SELECT id, message, is_user, timestamp FROM chat_messages '
+    "WHERE session_id = ? AND status = 'done' ORDER BY timestamp ASC"
+)
+
+# Upper bound on simultaneous LLM calls from this process, so a burst of chat
+# users queues here instead of opening unbounded connections to the Mistral API.
+MISTRAL_MAX_CONCURRENT = int(os.environ.get("MISTRAL_MAX_CONCURRENT", "16"))
+_llm_slots = threading.BoundedSemaphore(MISTRAL_MAX_CONCURRENT)
+
+# Set to "rq" to answer send_message in RQ workers (`rq worker quorial-rag`) rather
+# than in-process threads; REDIS_URL alone only enables the caches
+RAG_QUEUE = os.environ.get("RAG_QUEUE", "").strip().lower()
+
+# Threads answering send_message in the background when no RQ queue is configured
+RAG_EXECUTOR_WORKERS = int(os.environ.get("RAG_EXECUTOR_WORKERS", "8"))
+
+# How long the answer stream waits on a pending answer row. Answers computed in this
+# process wake it through an event, answers from other processes through Redis pub/sub;
+# only without Redis does it fall back to re-reading the row every ANSWER_POLL_INTERVAL.
+ANSWER_POLL_INTERVAL = 1.0
+ANSWER_WAIT_TIMEOUT = 300
+
+# Stored in place of an answer whose background job failed
+ANSWER_ERROR_MESSAGE = "Sorry, there was an error processing your message."
+
+# Repeated questions are answered from Redis for this many seconds (see also rag_cache)
+RAG_CACHE_TTL = 3600
+
+@functools.lru_cache(maxsize=1)
+def _get_redis():
+    """Return the shared Redis client, or None when caching is not configured."""
+    redis_url = os.environ.get("REDIS_URL")
+    if redis is None or not redis_url:
+        return None
+    return redis.Redis.from_url(redis_url)
+
+def _rag_cache_key(model: str, user_message: str) -> str:
+    normalized = rag_cache.normalize_query(user_message)
+    digest = hashlib.sha256(f"{model}|{normalized}".encode("utf-8")).hexdigest()
+    return f"rag:{digest}"
+
+def _get_cached_answer(model: str, user_message: str):
+    """Return the cached `{answer, sources}` dict for a question, or None on a miss.
+
+    The in-process cache (exact and near-duplicate questions) is checked
+    first, then the Redis cache shared by all workers.
+    """
+    hit = rag_cache.get_cached_answer(model, user_message)
+    if hit is not None:
+        return hit
+
+    client = _get_redis()
+    if client is None:
+        return None
+    try:
+        hit = client.get(_rag_cache_key(model, user_message))
+    except redis.RedisError as exc:
+        print(f"Redis unavailable, skipping answer cache: {exc}")
+        return None
+    if not hit:
+        return None
+    result = json.loads(hit)
+    rag_cache.put(model, user_message, result)
+    return result
+
+def _cache_answer(model: str, user_message: str, result: dict) -> None:
+    rag_cache.put(model, user_message, result)
+
+    client = _get_redis()
+    if client is None:
+        return
+    try:
+        client.setex(_rag_cache_key(model, user_message), RAG_CACHE_TTL, json.dumps(result))
+    except redis.RedisError as exc:
+        print(f"Redis unavailable, answer not cached: {exc}")
+
+# PDF export styles are built once at import; only the bubble indent depends on the page
+_STYLES = getSampleStyleSheet()
+_TITLE_STYLE = _STYLES['Title']
+_METADATA_STYLE = ParagraphStyle(
+    'Metadata',
+    parent=_STYLES['Normal'],
+    fontSize=11,
+    leading=16,
+)
+_USER_TEXT_COLOR = colors.HexColor('#000000')
+_AI_TEXT_COLOR = colors.HexColor('#212529')
+
+# Escapes message bodies for ReportLab paragraph markup in a single pass
+_PDF_ESCAPE = str.maketrans({
+    '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;', '\n': '<br/>',
+})
+
+# Exports larger than this are spooled to disk rather than kept in memory
+PDF_SPOOL_MAX_SIZE = 1 << 20
+
+# Rendered exports are kept in Redis for a day (the file cache keeps the latest render)
+PDF_CACHE_TTL = 86400
+
+# Sessions with more messages than this are rendered in parallel parts (needs pypdf);
+# below it the cost of handing work to another process outweighs the layout time
+PDF_PARALLEL_THRESHOLD = 100
+# Every export starts a new page after this many messages. Parts rendered in parallel
+# begin at those breaks, so the stitched file matches a single-pass render page for page.
+PDF_PART_SIZE = 50
+PDF_MAX_WORKERS = min(4, os.cpu_count() or 1)
+
+@functools.lru_cache(maxsize=8)
+def _make_bubble_styles(bubble_margin: float):
+    """Return the (user, ai) message styles indented by `bubble_margin`.
+
+    spaceAfter carries the gap between bubbles (frames collapse it with the
+    next spaceBefore), so each message is a single flowable.
+    """
+    user_style = ParagraphStyle(
+        'UserMessage',
+        parent=_STYLES['BodyText'],
+        fontSize=11,
+        leading=16,
+        textColor=_USER_TEXT_COLOR,
+        leftIndent=bubble_margin,
+        rightIndent=0,
+        alignment=TA_RIGHT,
+        spaceBefore=8,
+        spaceAfter=20,
+    )
+
+    ai_style = ParagraphStyle(
+        'AIMessage',
+        parent=_STYLES['BodyText'],
+        fontSize=11,
+        leading=16,
+        textColor=_AI_TEXT_COLOR,
+        leftIndent=0,
+        rightIndent=bubble_margin,
+        alignment=TA_LEFT,
+        spaceBefore=8,
+        spaceAfter=20,
+    )
+    return user_style, ai_style
+
+def _render_pdf(out, messages, title, created_at, include_header=True):
+    """Render chat messages as `(message, is_user, timestamp)` tuples into `out`.
+
+    A new page starts after every PDF_PART_SIZE messages.
+    """
+    doc = SimpleDocTemplate(
+        out,
+        pagesize=letter,
+        leftMargin=40,
+        rightMargin=40,
+        topMargin=50,
+        bottomMargin=50,
+        title=f"Chat Export - {title}"
+    )
+
+    user_style, ai_style = _make_bubble_styles(round(doc.width * 0.15, 1))
+
+    story = []
+    if include_header:
+        story = [
+            Paragraph('Quorial Chat Export', _TITLE_STYLE),
+            Spacer(1, 12),
+            Paragraph(f"Session: <b>{escape(title)}</b>", _METADATA_STYLE),
+            Paragraph(f"Created: {created_at}", _METADATA_STYLE),
+            Spacer(1, 16)
+        ]
+
+    if not messages:
+        story.append(Paragraph('No messages in this chat session yet.', _METADATA_STYLE))
+    else:
+        for index, (body, is_user, timestamp) in enumerate(messages):
+            if index and index % PDF_PART_SIZE == 0:
+                story.append(PageBreak())
+            role = 'You' if is_user else 'Quorial'
+            escaped_body = (body or '').translate(_PDF_ESCAPE)
+            block_html = (
+                f"<b>{role}</b>"
+                f"<br/><font size=9 color='#6c757d'>{timestamp}</font>"
+                f"<br/>{escaped_body}"
+            )
+
+            style = user_style if is_user else ai_style
+            story.append(Paragraph(block_html, style))
+
+    doc.build(story)
+
+def _render_pdf_part(messages, title, created_at, include_header):
+    """Worker entry point: render one slice of a long session and return the PDF bytes."""
+    out = BytesIO()
+    _render_pdf(out, messages, title, created_at, include_header)
+    return out.getvalue()
+
+def _pdf_cache_path(session_id, cache_key):
+    digest = hashlib.sha256(cache_key.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(current_app.config['PDF_CACHE_DIR'], f"chat-{session_id}-{digest}.pdf")
+
+def _get_cached_pdf(session_id, cache_key):
+    """Return the cached export (bytes stream or file path), or None on a miss."""
+    client = _get_redis()
+    if client is not None:
+        try:
+            cached = client.get(cache_key)
+            return BytesIO(cached) if cached else None
+        except redis.RedisError as exc:
+            print(f"Redis unavailable, using the PDF file cache: {exc}")
+
+    path = _pdf_cache_path(session_id, cache_key)
+    return path if os.path.exists(path) else None
+
+def _cache_pdf(session_id, cache_key, pdf_file):
+    """Store a rendered export in Redis, or on disk when Redis is not available."""
+    client = _get_redis()
+    if client is not None:
+        try:
+            client.setex(cache_key, PDF_CACHE_TTL, pdf_file.read())
+            return
+        except redis.RedisError as exc:
+            print(f"Redis unavailable, using the PDF file cache: {exc}")
+            pdf_file.seek(0)
+
+    os.makedirs(current_app.config['PDF_CACHE_DIR'], exist_ok=True)
+    path = _pdf_cache_path(session_id, cache_key)
+    # Older renders of this session are stale now
+    _drop_cached_pdfs(session_id)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        shutil.copyfileobj(pdf_file, f)
+    os.replace(tmp_path, path)
+
+def _drop_cached_pdfs(session_id):
+    """Remove every render of a session from the PDF file cache."""
+    pattern = os.path.join(current_app.config['PDF_CACHE_DIR'], f"chat-{session_id}-*.pdf")
+    for stale in glob.glob(pattern):
+        try:
+            os.remove(stale)
+        except FileNotFoundError:
+            pass  # removed concurrently by another request
+
+@functools.lru_cache(maxsize=1)
+def _get_pdf_pool():
+    """Process pool shared by all exports; created on the first long export.
+
+    Workers are spawned rather than forked: this process runs request and RAG
+    threads, and a fork could inherit locks one of them holds.
+    """
+    return ProcessPoolExecutor(
+        max_workers=PDF_MAX_WORKERS, mp_context=multiprocessing.get_context("spawn")
+    )
+
+@functools.lru_cache(maxsize=1)
+def _get_pipeline():
+    """Import the full RAG pipeline on first use.
+
+    The pipeline pulls in Chroma, sentence-transformers and the LLM SDKs, so
+    endpoints that never answer a question do not pay for that import.
+    """
+    # `src` is a top-level package next to flask_quorial; make sure its parent is importable
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if project_root not in sys.path:
+        sys.path.insert(0, project_root)
+
+    try:
+        from src.rag_pipeline import complete_rag_pipeline
+    except ImportError:
+        def complete_rag_pipeline(*_args, **_kwargs):  # type: ignore
+            raise RuntimeError(
+                "RAG pipeline is not available. Verify that src/ is on the PYTHONPATH."
+            )
+    return complete_rag_pipeline
+
+_WHITESPACE = re.compile(r"\s+")
+
+
 def derive_session_title_from_message(message: str) -> str:
     """Create a concise session title based on the first user question."""
-    cleaned = " ".join(message.strip().split())
+    cleaned = message.strip()
     if not cleaned:
         return "New Chat"
 
-    words = cleaned.split()
+    # Split off at most 9 parts: the first 8 words plus the unsplit remainder, if any
+    words = _WHITESPACE.split(cleaned, maxsplit=8)
     snippet = " ".join(words[:8])
 
     # Enforce a hard limit so titles stay tidy in the sidebar
@@ -46,11 +387,45 @@ def derive_session_title_from_message(message: str) -> str:
 
     return snippet
 
+_GREETING_REPLY = "Hi! Ask me about any Voxeurop article."
+_THANKS_REPLY = "You're welcome! Ask me anything else about Voxeurop articles."
+_BYE_REPLY = "Goodbye! Come back any time with a question about Voxeurop articles."
+_ACK_REPLY = "Great! Let me know if you have another question about Voxeurop articles."
+
+# Small talk answered without retrieval or an LLM call; add a phrase here to add an intent
+TRIVIAL_RESPONSES = {
+    "hi": _GREETING_REPLY,
+    "hello": _GREETING_REPLY,
+    "hey": _GREETING_REPLY,
+    "ok": _ACK_REPLY,
+    "okay": _ACK_REPLY,
+    "thanks": _THANKS_REPLY,
+    "thank you": _THANKS_REPLY,
+    "bye": _BYE_REPLY,
+    "goodbye": _BYE_REPLY,
+}
+_TRIVIAL_RE = re.compile(
+    r"^\s*(" + "|".join(sorted(map(re.escape, TRIVIAL_RESPONSES), key=len, reverse=True)) + r")\W*$",
+    re.IGNORECASE,
+)
+# Messages without a letter or digit ("?", "...") carry no question to retrieve for
+_NO_WORDS_RE = re.compile(r"^[\W_]*$")
+
+def _trivial_response(user_message: str):
+    """Return the canned reply for small talk (or a punctuation-only message), else None."""
+    if _NO_WORDS_RE.match(user_message):
+        return _GREETING_REPLY
+    match = _TRIVIAL_RE.match(user_message)
+    return TRIVIAL_RESPONSES[match.group(1).lower()] if match else None
+
 def generate_rag_response(user_message: str) -> dict:
     """Send the query + retrieved passages to the Mistral LLM for final answers.
 
     Returns a dict with keys `answer` (str) and `sources` (list).
     """
+    canned = _trivial_response(user_message)
+    if canned is not None:
+        return {"answer": canned, "sources": []}
 
     mistral_key = os.environ.get("MISTRAL_API_KEY")
     if not mistral_key:
@@ -60,17 +435,22 @@ def generate_rag_response(user_message: str) -> dict:
 
     mistral_model = os.environ.get("MISTRAL_MODEL", "mistral-small-latest")
 
+    cached = _get_cached_answer(mistral_model, user_message)
+    if cached is not None:
+        return cached
+
     try:
-        rag_result = complete_rag_pipeline(
-            query=user_message,
-            api_key=mistral_key,
-            provider="mistral",
-            model=mistral_model,
-            top_k=8,
-            context_window=2,
-            max_articles=2,
-            where=None,
-        )
+        with _llm_slots:
+            rag_result = _get_pipeline()(
+                query=user_message,
+                api_key=mistral_key,
+                provider="mistral",
+                model=mistral_model,
+                top_k=8,
+                context_window=2,
+                max_articles=2,
+                where=None,
+            )
     except Exception as exc:
         print(f"Error in RAG pipeline: {exc}")
         return {"answer": "I encountered an error (APIKey missing) while generating an answer with the knowledge base.", "sources": []}
@@ -80,7 +460,232 @@ def generate_rag_response(user_message: str) -> dict:
         return {"answer": "I could not generate an answer from the retrieved articles.", "sources": []}
 
     sources = rag_result.get("sources") or []
-    return {"answer": answer, "sources": sources}
+    result = {"answer": answer, "sources": sources}
+    _cache_answer(mistral_model, user_message, result)
+    return result
+
+def stream_rag_response(user_message: str) -> dict:
+    """Streaming variant of `generate_rag_response`.
+
+    Returns a dict with keys `chunks` (iterator of answer text pieces) and
+    `sources` (list, filled in once `chunks` has been consumed). Errors are
+    reported as a single text chunk so the caller can forward them to the
+    client like any other answer.
+    """
+    result = {"chunks": None, "sources": []}
+
+    def chunks():
+        canned = _trivial_response(user_message)
+        if canned is not None:
+            yield canned
+            return
+
+        mistral_key = os.environ.get("MISTRAL_API_KEY")
+        if not mistral_key:
+            yield ("Mistral API key missing. Set the MISTRAL_API_KEY environment variable "
+                   "before using the chat assistant.")
+            return
+
+        mistral_model = os.environ.get("MISTRAL_MODEL", "mistral-small-latest")
+
+        cached = _get_cached_answer(mistral_model, user_message)
+        if cached is not None:
+            result["sources"] = cached["sources"]
+            yield cached["answer"]
+            return
+
+        # Hold an LLM slot for the whole stream; released on completion or disconnect
+        with _llm_slots:
+            try:
+                rag_result = _get_pipeline()(
+                    query=user_message,
+                    api_key=mistral_key,
+                    provider="mistral",
+                    model=mistral_model,
+                    top_k=8,
+                    context_window=2,
+                    max_articles=2,
+                    where=None,
+                    stream=True,
+                )
+            except Exception as exc:
+                print(f"Error in RAG pipeline: {exc}")
+                yield "I encountered an error (APIKey missing) while generating an answer with the knowledge base."
+                return
+
+            result["sources"] = rag_result.get("sources") or []
+            answer = StringIO()
+            try:
+                for chunk in rag_result.get("answer") or ():
+                    answer.write(chunk)
+                    yield chunk
+            except Exception as exc:
+                print(f"Error while streaming RAG answer: {exc}")
+                yield "I encountered an error while generating an answer with the knowledge base."
+                return
+
+        if answer.getvalue():
+            _cache_answer(mistral_model, user_message, {"answer": answer.getvalue(), "sources": result["sources"]})
+
+    result["chunks"] = chunks()
+    return result
+
+def _store_question(db, session_id, message, is_first_user_message):
+    """Persist a user message and a pending answer row for it in one transaction.
+
+    Returns the answer row id and the new session title (None unless this was
+    the first message). The row is completed by `_fill_answer` or `_fail_answer`.
+    """
+    session_title = derive_session_title_from_message(message) if is_first_user_message else None
+
+    # One write transaction: both rows, then one UPDATE that only replaces the
+    # title when a new one was derived.
+    with db:
+        db.execute('BEGIN IMMEDIATE')
+        db.execute(SQL_INSERT_MESSAGE, (session_id, message, True))
+        answer_id = db.execute(SQL_INSERT_PENDING_ANSWER, (session_id,)).lastrowid
+        db.execute(SQL_TOUCH_SESSION, (session_title, 2, session_id))
+
+    return answer_id, session_title
+
+def _fill_answer(db, session_id, answer_id, ai_response):
+    with db:
+        db.execute(SQL_FILL_ANSWER, (ai_response, answer_id))
+        # Touch the session so cached exports of it are not reused
+        db.execute(SQL_TOUCH_SESSION, (None, 0, session_id))
+
+def _fail_answer(db, answer_id):
+    with db:
+        db.execute(SQL_FAIL_ANSWER, (ANSWER_ERROR_MESSAGE, answer_id))
+
+# Pending answers being computed by this process, by answer row id
+_answer_events_lock = threading.Lock()
+_answer_events = {}
+
+def _answer_channel(answer_id):
+    return f"quorial:answer:{answer_id}"
+
+def _expect_answer(answer_id):
+    """Register a pending answer computed in this process so readers can wait on it."""
+    with _answer_events_lock:
+        _answer_events[answer_id] = threading.Event()
+
+def _notify_answer(answer_id):
+    """Wake everyone waiting on an answer row that is no longer pending."""
+    with _answer_events_lock:
+        event = _answer_events.pop(answer_id, None)
+    if event is not None:
+        event.set()
+
+    client = _get_redis()
+    if client is None:
+        return
+    try:
+        client.publish(_answer_channel(answer_id), b"1")
+    except redis.RedisError as exc:
+        print(f"Redis unavailable, answer {answer_id} not announced: {exc}")
+
+def _wait_for_answer(message_id):
+    """Return the answer row once it is no longer pending, or None after ANSWER_WAIT_TIMEOUT.
+
+    The pooled DB connection is handed back while waiting.
+    """
+    deadline = time.monotonic() + ANSWER_WAIT_TIMEOUT
+    # Looked up before the row is read: an answer finished in between has already
+    # written its row, so it cannot be missed
+    with _answer_events_lock:
+        event = _answer_events.get(message_id)
+
+    pubsub = None
+    client = _get_redis() if event is None else None
+    if client is not None:
+        try:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(_answer_channel(message_id))
+        except redis.RedisError as exc:
+            print(f"Redis unavailable, polling for answer {message_id}: {exc}")
+            pubsub = None
+
+    try:
+        while True:
+            row = get_db().execute(SQL_MESSAGE_STATUS, (message_id,)).fetchone()
+            if row is None or row['status'] != 'pending':
+                return row
+            close_db()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            if event is not None:
+                event.wait(remaining)
+                continue
+            if pubsub is not None:
+                try:
+                    pubsub.get_message(timeout=remaining)
+                    continue
+                except redis.RedisError as exc:
+                    print(f"Redis unavailable, polling for answer {message_id}: {exc}")
+                    pubsub = None
+            time.sleep(min(ANSWER_POLL_INTERVAL, remaining))
+    finally:
+        if pubsub is not None:
+            pubsub.close()
+
+def _answer_pending(session_id, answer_id, message):
+    """Answer a stored question and fill in its pending answer row.
+
+    Must run inside an app context; returns the answer and its sources. On
+    failure the row is marked 'error' (so readers stop waiting on it) and the
+    exception is re-raised.
+    """
+    db = get_db()
+    try:
+        rag_out = generate_rag_response(message)
+        ai_response = rag_out.get('answer') if isinstance(rag_out, dict) else str(rag_out)
+        sources = rag_out.get('sources') if isinstance(rag_out, dict) else []
+
+        _fill_answer(db, session_id, answer_id, ai_response)
+    except Exception:
+        _fail_answer(db, answer_id)
+        raise
+    finally:
+        _notify_answer(answer_id)
+
+    return {'ai_response': ai_response, 'sources': sources}
+
+@functools.lru_cache(maxsize=1)
+def _get_rag_queue():
+    """Return the RQ queue for background answers, or None to answer in-process."""
+    if RAG_QUEUE != "rq":
+        return None
+    client = _get_redis()
+    if Queue is None or client is None:
+        print("RAG_QUEUE=rq needs the rq package and REDIS_URL; answering in-process")
+        return None
+    return Queue('quorial-rag', connection=client)
+
+@functools.lru_cache(maxsize=1)
+def _get_rag_executor():
+    """Thread pool answering send_message in-process; created on first use."""
+    return ThreadPoolExecutor(max_workers=RAG_EXECUTOR_WORKERS, thread_name_prefix='quorial-rag')
+
+@functools.lru_cache(maxsize=1)
+def _worker_app():
+    """Flask app used by RQ workers, which run outside any request."""
+    from flask_quorial import create_app
+    return create_app()
+
+def _process_rag(session_id, answer_id, message):
+    """RQ job: answer a stored question and fill in its answer row."""
+    with _worker_app().app_context():
+        return _answer_pending(session_id, answer_id, message)
+
+def _run_rag(app, session_id, answer_id, message):
+    """Executor task: same as `_process_rag`, in a thread of this process."""
+    with app.app_context():
+        try:
+            _answer_pending(session_id, answer_id, message)
+        except Exception as exc:
+            print(f"Error answering message {answer_id} in the background: {exc}")
 
 @bp.route('/')
 @login_required
@@ -99,40 +704,52 @@ def get_sessions():
         (g.user['id'],)
     ).fetchall()
     
-    return jsonify([{
-        'id': session['id'],
-        'title': session['title'],
-        'created_at': session['created_at'],
-        'updated_at': session['updated_at']
-    } for session in sessions])
+    return jsonify([dict(session) for session in sessions])
 
 @bp.route('/session/<int:session_id>')
 @login_required
 def get_session(session_id):
-    """Get messages from a specific chat session"""
+    """Get one page of messages from a chat session, oldest first within the page.
+
+    The page is columnar: parallel `ids`, `messages`, `is_user`, `statuses`
+    and `timestamps` arrays. Pages are keyed on the message id. By default
+    the newest messages are returned; pass the returned `prev_cursor` as
+    `before_id` to get the page before it (None when there is none). To read
+    forward instead, pass `after_id` and follow `next_cursor`.
+    """
+    limit = min(max(request.args.get('limit', MESSAGES_PAGE_SIZE, type=int), 1), MESSAGES_PAGE_MAX)
+    after_id = request.args.get('after_id', type=int)
+
     db = get_db()
-    
-    # Verify session belongs to current user
-    session_check = db.execute(
-        'SELECT id FROM chat_sessions WHERE id = ? AND user_id = ?',
-        (session_id, g.user['id'])
-    ).fetchone()
-    
-    if session_check is None:
+    if after_id is not None:
+        messages = db.execute(
+            SQL_SESSION_MESSAGES_PAGE, (after_id, session_id, g.user['id'], limit)
+        ).fetchall()
+    else:
+        before_id = request.args.get('before_id', SQLITE_MAX_ROWID, type=int)
+        messages = db.execute(
+            SQL_SESSION_MESSAGES_PAGE_BEFORE, (before_id, session_id, g.user['id'], limit)
+        ).fetchall()[::-1]
+    if not messages:
         return jsonify({'error': 'Session not found'}), 404
     
-    messages = db.execute(
-        'SELECT id, message, is_user, timestamp FROM chat_messages '
-        'WHERE session_id = ? ORDER BY timestamp ASC',
-        (session_id,)
-    ).fetchall()
-    
-    return jsonify([{
-        'id': msg['id'],
-        'message': msg['message'],
-        'is_user': bool(msg['is_user']),
-        'timestamp': msg['timestamp']
-    } for msg in messages])
+    if messages[0]['id'] is None:
+        messages = []  # the session exists but has no (further) messages
+
+    ids, texts, is_user, statuses, timestamps = zip(*messages) if messages else ((),) * 5
+    full_page = len(ids) == limit
+    page = {
+        'ids': ids,
+        'messages': texts,
+        'is_user': [bool(flag) for flag in is_user],
+        'statuses': statuses,
+        'timestamps': timestamps,
+    }
+    if after_id is not None:
+        page['next_cursor'] = ids[-1] if full_page else None
+    else:
+        page['prev_cursor'] = ids[0] if full_page else None
+    return jsonify(page)
 
 @bp.route('/session/<int:session_id>/export', methods=['GET'])
 @login_required
@@ -149,90 +766,53 @@ def export_session_pdf(session_id):
     if session_row is None:
         return jsonify({'error': 'Session not found'}), 404
 
-    messages = db.execute(
-        'SELECT message, is_user, timestamp FROM chat_messages '
-        'WHERE session_id = ? ORDER BY timestamp ASC',
-        (session_id,)
-    ).fetchall()
-
-    pdf_buffer = BytesIO()
-    doc = SimpleDocTemplate(
-        pdf_buffer,
-        pagesize=letter,
-        leftMargin=40,
-        rightMargin=40,
-        topMargin=50,
-        bottomMargin=50,
-        title=f"Chat Export - {session_row['title']}"
-    )
-
-    styles = getSampleStyleSheet()
-    title_style = styles['Title']
-    metadata_style = ParagraphStyle(
-        'Metadata',
-        parent=styles['Normal'],
-        fontSize=11,
-        leading=16,
-    )
+    messages = db.execute(SQL_EXPORT_MESSAGES, (session_id,)).fetchall()
 
-    bubble_margin = doc.width * 0.15
-
-    user_style = ParagraphStyle(
-        'UserMessage',
-        parent=styles['BodyText'],
-        fontSize=11,
-        leading=16,
-        textColor=colors.HexColor('#000000'),
-        leftIndent=bubble_margin,
-        rightIndent=0,
-        alignment=TA_RIGHT,
-        spaceBefore=8,
-        spaceAfter=8,
-    )
+    # updated_at only has one-second resolution, so the exported messages (their count
+    # and newest id) and the title are part of the key as well
+    version = hashlib.sha256(
+        f"{session_row['updated_at']}|{len(messages)}|{max((m['id'] for m in messages), default=0)}|"
+        f"{session_row['title']}".encode("utf-8")
+    ).hexdigest()[:16]
+    cache_key = f"pdf:{session_id}:{version}"
+    filename = f"chat-session-{session_id}.pdf"
+    cached = _get_cached_pdf(session_id, cache_key)
+    if cached is not None:
+        return send_file(
+            cached,
+            as_attachment=True,
+            download_name=filename,
+            mimetype='application/pdf'
+        )
 
-    ai_style = ParagraphStyle(
-        'AIMessage',
-        parent=styles['BodyText'],
-        fontSize=11,
-        leading=16,
-        textColor=colors.HexColor('#212529'),
-        leftIndent=0,
-        rightIndent=bubble_margin,
-        alignment=TA_LEFT,
-        spaceBefore=8,
-        spaceAfter=8,
-    )
+    # Plain tuples so long sessions can be handed to the render worker processes
+    messages = [(m['message'], bool(m['is_user']), m['timestamp']) for m in messages]
+    title = session_row['title']
+    created_at = session_row['created_at']
 
-    story = [
-        Paragraph('Quorial Chat Export', title_style),
-        Spacer(1, 12),
-        Paragraph(f"Session: <b>{escape(session_row['title'])}</b>", metadata_style),
-        Paragraph(f"Created: {session_row['created_at']}", metadata_style),
-        Spacer(1, 16)
-    ]
+    # Small exports stay in memory; larger ones spill to a temp file that
+    # send_file then streams out in chunks instead of holding it in RAM.
+    pdf_buffer = SpooledTemporaryFile(max_size=PDF_SPOOL_MAX_SIZE)
 
-    if not messages:
-        story.append(Paragraph('No messages in this chat session yet.', metadata_style))
-    else:
-        for message in messages:
-            is_user = bool(message['is_user'])
-            role = 'You' if is_user else 'Quorial'
-            timestamp = message['timestamp']
-            escaped_body = escape(message['message'] or '').replace('\n', '<br/>')
-            block_html = (
-                f"<b>{role}</b>"
-                f"<br/><font size=9 color='#6c757d'>{timestamp}</font>"
-                f"<br/>{escaped_body}"
+    if PdfWriter is not None and PDF_MAX_WORKERS > 1 and len(messages) > PDF_PARALLEL_THRESHOLD:
+        # Lay out the parts between page breaks in parallel, then stitch them back in order
+        futures = [
+            _get_pdf_pool().submit(
+                _render_pdf_part, messages[start:start + PDF_PART_SIZE], title, created_at, start == 0
             )
-
-            style = user_style if is_user else ai_style
-            story.append(Paragraph(block_html, style))
-            story.append(Spacer(1, 4))
-
-    doc.build(story)
+            for start in range(0, len(messages), PDF_PART_SIZE)
+        ]
+        writer = PdfWriter()
+        for future in futures:
+            writer.append(BytesIO(future.result()))
+        writer.add_metadata({'/Title': f"Chat Export - {title}"})
+        writer.write(pdf_buffer)
+    else:
+        _render_pdf(pdf_buffer, messages, title, created_at)
+    pdf_buffer.seek(0)
+    _cache_pdf(session_id, cache_key, pdf_buffer)
     pdf_buffer.seek(0)
 
-    filename = f"chat-session-{session_id}.pdf"
     return send_file(
         pdf_buffer,
         as_attachment=True,
@@ -244,8 +824,10 @@ def export_session_pdf(session_id):
 @login_required
 def create_session():
     """Create a new chat session"""
-    data = request.get_json()
-    title = data.get('title', 'New Chat')
+    data = request.get_json(silent=True) or {}
+    title = data.get('title') or 'New Chat'
+    if len(title) > SESSION_TITLE_MAX_LENGTH:
+        return jsonify({'error': 'Title is too long'}), 400
     
     db = get_db()
     cursor = db.execute(
@@ -260,68 +842,170 @@ def create_session():
 @bp.route('/session/<int:session_id>/message', methods=['POST'])
 @login_required
 def send_message(session_id):
-    """Send a message to a chat session"""
-    db = get_db()
-    
-    # Verify session belongs to current user
-    session_check = db.execute(
-        'SELECT id FROM chat_sessions WHERE id = ? AND user_id = ?',
-        (session_id, g.user['id'])
-    ).fetchone()
-    
-    if session_check is None:
-        return jsonify({'error': 'Session not found'}), 404
-    
-    data = request.get_json()
-    message = data.get('message', '').strip()
+    """Send a message to a chat session.
+
+    Answers in the background and returns 202 with the pending answer's
+    `assistant_id` (and the RQ `job_id` when queued); the answer is then read
+    from /chat/session/<id>/message/<assistant_id>/stream. With `"wait": true`
+    in the body the request answers synchronously and returns 200 with
+    `ai_response` and `sources`, as before background answering.
+    """
+    # Validate the body before any session lookup so empty posts cost nothing
+    data = request.get_json(silent=True) or {}
+    message = (data.get('message') or '').strip()
     
     if not message:
         return jsonify({'error': 'Message cannot be empty'}), 400
 
-    existing_count_row = db.execute(
-        'SELECT COUNT(*) AS cnt FROM chat_messages WHERE session_id = ?',
-        (session_id,)
-    ).fetchone()
-    is_first_user_message = existing_count_row is None or existing_count_row['cnt'] == 0
-    
-    # Add user message
-    db.execute(
-        'INSERT INTO chat_messages (session_id, message, is_user) VALUES (?, ?, ?)',
-        (session_id, message, True)
-    )
-    
-    # Generate AI response using RAG pipeline (structured output)
-    rag_out = generate_rag_response(message)
-    ai_response = rag_out.get('answer') if isinstance(rag_out, dict) else str(rag_out)
-    sources = rag_out.get('sources') if isinstance(rag_out, dict) else []
-
-    # Add AI response (store only the textual answer)
-    db.execute(
-        'INSERT INTO chat_messages (session_id, message, is_user) VALUES (?, ?, ?)',
-        (session_id, ai_response, False)
-    )
-    
-    session_title = None
-    if is_first_user_message:
-        session_title = derive_session_title_from_message(message)
-        db.execute(
-            'UPDATE chat_sessions SET title = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
-            (session_title, session_id)
+    # One lookup both verifies ownership and tells whether this is the first message
+    db = get_db()
+    session = db.execute(SQL_SESSION_MESSAGE_COUNT, (session_id, g.user['id'])).fetchone()
+    if session is None:
+        return jsonify({'error': 'Session not found'}), 404
+    is_first_user_message = session['message_count'] == 0
+
+    # Store the question and a pending answer row, then answer in the background
+    # (an RQ worker when configured, else a local thread) so this request returns at once
+    assistant_id, session_title = _store_question(db, session_id, message, is_first_user_message)
+
+    payload = {
+        'user_message': message,
+        'assistant_id': assistant_id,
+        'session_title': session_title,
+    }
+
+    if data.get('wait'):
+        try:
+            result = _answer_pending(session_id, assistant_id, message)
+        except Exception as exc:
+            print(f"Error answering message {assistant_id}: {exc}")
+            return jsonify({**payload, 'error': ANSWER_ERROR_MESSAGE}), 500
+        return jsonify({**payload, 'ai_response': result['ai_response'], 'sources': result['sources']})
+
+    queue = _get_rag_queue()
+    if queue is not None:
+        job = queue.enqueue(
+            _process_rag, session_id, assistant_id, message,
+            meta={'user_id': g.user['id']},
         )
+        payload['job_id'] = job.id
     else:
-        db.execute(
-            'UPDATE chat_sessions SET updated_at = CURRENT_TIMESTAMP WHERE id = ?',
-            (session_id,)
+        _expect_answer(assistant_id)
+        _get_rag_executor().submit(
+            _run_rag, current_app._get_current_object(), session_id, assistant_id, message
         )
 
-    db.commit()
+    return jsonify(payload), 202
 
-    return jsonify({
-        'user_message': message,
-        'ai_response': ai_response,
-        'sources': sources,
-        'session_title': session_title,
-    })
+@bp.route('/session/<int:session_id>/message/<int:message_id>/stream')
+@login_required
+def stream_answer(session_id, message_id):
+    """Stream a background answer from send_message as server-sent events.
+
+    Waits while the answer row is pending, then sends `data: {"text": ...}`
+    followed by a final `done` event, or a single `error` event when the
+    answer failed.
+    """
+    row = get_db().execute(SQL_OWNED_MESSAGE, (message_id, session_id, g.user['id'])).fetchone()
+    if row is None:
+        return jsonify({'error': 'Message not found'}), 404
+
+    def generate():
+        current = row if row['status'] != 'pending' else _wait_for_answer(message_id)
+        if current is None:
+            yield f"data: {json.dumps({'error': 'Timed out waiting for the answer'})}\n\n"
+            return
+
+        if current['status'] != 'done':
+            yield f"data: {json.dumps({'error': current['message'] or ANSWER_ERROR_MESSAGE})}\n\n"
+            return
+
+        yield f"data: {json.dumps({'text': current['message']})}\n\n"
+        yield f"data: {json.dumps({'done': True})}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+@bp.route('/job/<job_id>')
+@login_required
+def get_job(job_id):
+    """Report the status (and result, once finished) of a queued answer"""
+    queue = _get_rag_queue()
+    if queue is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    try:
+        job = Job.fetch(job_id, connection=queue.connection)
+    except NoSuchJobError:
+        return jsonify({'error': 'Job not found'}), 404
+
+    if job.meta.get('user_id') != g.user['id']:
+        return jsonify({'error': 'Job not found'}), 404
+
+    return jsonify({'status': job.get_status(), 'result': job.result})
+
+@bp.route('/session/<int:session_id>/message/stream', methods=['POST'])
+@login_required
+def stream_message(session_id):
+    """Send a message and stream the AI answer back as server-sent events.
+
+    Each answer chunk is sent as `data: {"text": ...}`; the final event carries
+    `done`, the sources, the (possibly new) session title and the answer's
+    `assistant_id`. The question and a pending answer row are stored before
+    streaming starts; the row is filled once the stream has finished, or marked
+    'error' when it fails or the client goes away.
+    """
+    # Validate the body before any session lookup so empty posts cost nothing
+    data = request.get_json(silent=True) or {}
+    message = (data.get('message') or '').strip()
+    
+    if not message:
+        return jsonify({'error': 'Message cannot be empty'}), 400
+
+    # One lookup both verifies ownership and tells whether this is the first message
+    db = get_db()
+    session = db.execute(SQL_SESSION_MESSAGE_COUNT, (session_id, g.user['id'])).fetchone()
+    if session is None:
+        return jsonify({'error': 'Session not found'}), 404
+    is_first_user_message = session['message_count'] == 0
+
+    assistant_id, session_title = _store_question(db, session_id, message, is_first_user_message)
+
+    def generate():
+        rag_out = stream_rag_response(message)
+        answer = StringIO()
+        stored = False
+        try:
+            for chunk in rag_out['chunks']:
+                answer.write(chunk)
+                yield f"data: {json.dumps({'text': chunk})}\n\n"
+
+            ai_response = answer.getvalue()
+            fallback = not ai_response
+            if fallback:
+                ai_response = "I could not generate an answer from the retrieved articles."
+            _fill_answer(get_db(), session_id, assistant_id, ai_response)
+            stored = True
+        finally:
+            # Runs on errors and on client disconnects (GeneratorExit at a yield) alike
+            if not stored:
+                _fail_answer(get_db(), assistant_id)
+            _notify_answer(assistant_id)
+
+        if fallback:
+            yield f"data: {json.dumps({'text': ai_response})}\n\n"
+        done = {'done': True, 'sources': rag_out['sources'], 'session_title': session_title,
+                'assistant_id': assistant_id}
+        yield f"data: {json.dumps(done)}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
 
 @bp.route('/session/<int:session_id>/delete', methods=['DELETE'])
 @login_required
@@ -329,45 +1013,42 @@ def delete_session(session_id):
     """Delete a chat session"""
     db = get_db()
     
-    # Verify session belongs to current user
-    session_check = db.execute(
-        'SELECT id FROM chat_sessions WHERE id = ? AND user_id = ?',
+    # Ownership is part of the DELETE itself; no row deleted means no such session
+    cursor = db.execute(
+        'DELETE FROM chat_sessions WHERE id = ? AND user_id = ?',
         (session_id, g.user['id'])
-    ).fetchone()
-    
-    if session_check is None:
-        return jsonify({'error': 'Session not found'}), 404
-    
-    db.execute('DELETE FROM chat_sessions WHERE id = ?', (session_id,))
+    )
     db.commit()
     
+    if cursor.rowcount == 0:
+        return jsonify({'error': 'Session not found'}), 404
+
+    _drop_cached_pdfs(session_id)
     return jsonify({'success': True})
 
 @bp.route('/session/<int:session_id>/rename', methods=['PUT'])
 @login_required
 def rename_session(session_id):
     """Rename a chat session"""
-    db = get_db()
-    
-    # Verify session belongs to current user
-    session_check = db.execute(
-        'SELECT id FROM chat_sessions WHERE id = ? AND user_id = ?',
-        (session_id, g.user['id'])
-    ).fetchone()
-    
-    if session_check is None:
-        return jsonify({'error': 'Session not found'}), 404
-    
-    data = request.get_json()
-    new_title = data.get('title', '').strip()
+    data = request.get_json(silent=True) or {}
+    new_title = (data.get('title') or '').strip()
     
     if not new_title:
         return jsonify({'error': 'Title cannot be empty'}), 400
+    if len(new_title) > SESSION_TITLE_MAX_LENGTH:
+        return jsonify({'error': 'Title is too long'}), 400
+
+    db = get_db()
     
-    db.execute(
-        'UPDATE chat_sessions SET title = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
-        (new_title, session_id)
+    # Ownership is part of the UPDATE itself; no row updated means no such session
+    cursor = db.execute(
+        'UPDATE chat_sessions SET title = ?, updated_at = CURRENT_TIMESTAMP '
+        'WHERE id = ? AND user_id = ?',
+        (new_title, session_id, g.user['id'])
     )
     db.commit()
     
+    if cursor.rowcount == 0:
+        return jsonify({'error': 'Session not found'}), 404
+    
     return jsonify({'success': True, 'title': new_title})
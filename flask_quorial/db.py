@@ -1,49 +1,128 @@
+"""SQLite access for the app: pooled per-request connections and the init-db command.
+
+Tracing goes through the module logger at DEBUG level, so it costs nothing
+unless debug logging is switched on.
+"""
+import logging
+import queue
 import sqlite3 
 import click  # CLI helper to register custom Flask commands.
 from flask import current_app, g  # current_app points to the active Flask app; g stores request-scoped data.
 
-def get_db():
-        print('get_db(): before db is accessed...', flush=True)  # Trace whenever a DB connection is requested.
+logger = logging.getLogger(__name__)
+
+def _connect(database):
+    # Open a connection to the SQLite file specified in the Flask config.
+    db = sqlite3.connect(
+        database,
+        detect_types=sqlite3.PARSE_DECLTYPES,  # Enable automatic conversion of SQLite types to Python types.
+        cached_statements=256,  # Keep compiled statements around so repeated queries skip parsing.
+        check_same_thread=False  # Pooled connections are handed from one request thread to the next.
+    )
+    # Configure the connection to return rows as dict-like objects for convenient column access.
+    db.row_factory = sqlite3.Row
+    # WAL lets readers continue while a chat message is written; NORMAL sync is safe with WAL
+    # and avoids an fsync on every commit.
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('PRAGMA synchronous=NORMAL')
+    # Wait up to 5s for the writer lock instead of failing with "database is locked".
+    db.execute('PRAGMA busy_timeout=5000')
+    # Keep temp tables/indices in RAM and read the file through a 256 MiB memory map.
+    db.execute('PRAGMA temp_store=MEMORY')
+    db.execute('PRAGMA mmap_size=268435456')
+    # 64 MB page cache per connection (negative values are KiB).
+    db.execute('PRAGMA cache_size=-64000')
+    # Enforce the schema's foreign keys so deleting a session cascades to its messages.
+    db.execute('PRAGMA foreign_keys=ON')
+    return db
+
+def migrate_db():
+    # Bring a database created from an older schema.sql up to date; run once per app at startup.
+    db = _connect(current_app.config['DATABASE'])
+    try:
+        # The write lock is taken before looking at the schema, so app processes starting
+        # together migrate one after the other and the later ones find nothing to do.
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            _migrate(db)
+    finally:
+        db.close()
+
+def _migrate(db):
+    # A missing table (fresh file before init-db) yields no columns and is left to schema.sql.
+    columns = {row['name'] for row in db.execute('PRAGMA table_info(chat_sessions)')}
+    if not columns:
+        return
 
-        # Lazily create and cache a connection the first time this request needs it.
+    # Sidebar listing, chat history and export read through these (no-ops once they exist).
+    db.execute('CREATE INDEX IF NOT EXISTS ix_sess_user_upd ON chat_sessions (user_id, updated_at DESC)')
+    db.execute('CREATE INDEX IF NOT EXISTS ix_msgs_sess_ts ON chat_messages (session_id, timestamp)')
+    db.execute('CREATE INDEX IF NOT EXISTS ix_msgs_sess_id ON chat_messages (session_id, id)')
+
+    # Answers written before background answering existed are all complete.
+    message_columns = {row['name'] for row in db.execute('PRAGMA table_info(chat_messages)')}
+    if 'status' not in message_columns:
+        db.execute("ALTER TABLE chat_messages ADD COLUMN status TEXT NOT NULL DEFAULT 'done'")
+
+    # message_count is added once, backfilled from the messages already stored.
+    if 'message_count' not in columns:
+        db.execute('ALTER TABLE chat_sessions ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0')
+        db.execute(
+            'UPDATE chat_sessions SET message_count = '
+            '(SELECT COUNT(*) FROM chat_messages WHERE session_id = chat_sessions.id)'
+        )
+
+def get_db():
+        # Lazily check out a connection the first time this request needs it.
         if 'db' not in g:
-            # Open a connection to the SQLite file specified in the Flask config.
-            g.db = sqlite3.connect(
-                current_app.config['DATABASE'],
-                detect_types=sqlite3.PARSE_DECLTYPES  # Enable automatic conversion of SQLite types to Python types.
-            )
-            # Configure the connection to return rows as dict-like objects for convenient column access.
-            g.db.row_factory = sqlite3.Row
+            pool = current_app.extensions['quorial_db_pool']
+            try:
+                g.db = pool.get_nowait()  # Reuse an idle connection (no connect + PRAGMA cost).
+            except queue.Empty:
+                g.db = _connect(current_app.config['DATABASE'])
 
         return g.db  # Reuse the cached connection for the rest of the request.
 
 def close_db(e=None):
     db = g.pop('db', None)  # Remove and retrieve the cached connection, if any.
 
-    # Close the connection to avoid leaking resources.
-    if db is not None:
+    if db is None:
+        return
+
+    # Never hand a half-finished transaction to the next request.
+    if db.in_transaction:
+        db.rollback()
+
+    # Return the connection to the pool; close it when the pool already holds enough idle ones.
+    try:
+        current_app.extensions['quorial_db_pool'].put_nowait(db)
+    except queue.Full:
         db.close()
 
 def init_db():
     db = get_db()  # Obtain the shared connection for initialization work.
-    print('init_db(): get_db()...', flush=True)  # Log that initialization is underway.
+    logger.debug('init_db(): get_db()...')  # Log that initialization is underway.
 
     # Create the schema from the bundled SQL file (path is relative to the Flask package).
     with current_app.open_resource('tools/schema.sql') as f:
         db.executescript(f.read().decode('utf8'))  # Execute the entire schema script at once.
-        print('init_db(): schema successfully created...', flush=True)  # Confirm schema creation.
+        logger.debug('init_db(): schema successfully created...')  # Confirm schema creation.
 
     # Populate the tables with seed data using the second SQL script.
     with current_app.open_resource('tools/db_insertdata.sql') as f:
         db.executescript(f.read().decode('utf8'))  # Insert the initial content bundled with the project.
-        print('init_db(): data successfully inserted...', flush=True)  # Confirm data insertion.
+        logger.debug('init_db(): data successfully inserted...')  # Confirm data insertion.
 
 @click.command('init-db')
 def init_db_command():
     """Clear the existing data and create new tables."""
     init_db()  # Run the initialization logic when the CLI command is invoked.
-    print('init_db_command(): init_db() done...', flush=True)  # Provide feedback to the terminal user.
+    click.echo('Initialized the database.')  # Provide feedback to the terminal user.
 
 def init_app(app):
+        # Idle connections kept per app process (LIFO so the warmest connection is reused first).
+        app.extensions['quorial_db_pool'] = queue.LifoQueue(maxsize=app.config['DB_POOL_SIZE'])
         app.teardown_appcontext(close_db)  # Register the cleanup hook so connections close after each request.
         app.cli.add_command(init_db_command)  # Make `flask init-db` available via the CLI.
+        with app.app_context():
+            migrate_db()  # Upgrade an existing database once, not on every pooled connection.
@@ -0,0 +1,29 @@
+# JSON provider backed by orjson (optional - Flask's default provider is used without it)
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Dates go to `default` (Flask's HTTP date format), so responses look the same with or
+# without orjson; int dict keys are allowed like in the stdlib encoder
+ORJSON_OPTIONS = (
+    orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Drop-in replacement for Flask's JSON provider that encodes with orjson."""
+
+    def dumps(self, obj, **kwargs):
+        option = ORJSON_OPTIONS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=kwargs.get('default', self.default), option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
@@ -0,0 +1,154 @@
+# In-process answer cache for the RAG chat (exact + semantic tiers)
+
+import functools
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# numpy and Chroma's embedding function are optional here: without them only
+# the exact-match tier is used
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Repeated questions (after normalization) kept per process
+EXACT_CACHE_SIZE = 512
+# Near-duplicate questions kept per model; the ring buffer overwrites the oldest
+SEMANTIC_CACHE_SIZE = 2048
+# Cosine similarity above which a cached answer is reused for a new question
+SEMANTIC_THRESHOLD = 0.95
+# The semantic tier is opt-in (RAG_SEMANTIC_CACHE=1): embeddings of questions that
+# differ only in a year or a country can still score above the threshold
+SEMANTIC_CACHE_ENABLED = os.environ.get("RAG_SEMANTIC_CACHE", "").lower() in {"1", "true", "yes"}
+
+# Numbers and capitalized words past the first one (years, countries, parties, ...)
+_ENTITY_RE = re.compile(r"\d+|(?<=\s)[A-Z][\w-]*")
+
+_lock = threading.Lock()
+_exact = OrderedDict()
+_semantic = {}
+# Set once the embedder fails, so later questions skip the semantic tier outright
+_embedder_failed = False
+
+
+def normalize_query(query: str) -> str:
+    """Lower-case the question and collapse whitespace so trivial variants share a key."""
+    return " ".join(query.split()).lower()
+
+
+def _entities(query: str) -> frozenset:
+    """Return the numbers and proper names of a question, which a semantic hit must share."""
+    return frozenset(match.lower() for match in _ENTITY_RE.findall(query))
+
+
+@functools.lru_cache(maxsize=1)
+def _get_embedder():
+    """Return the embedding function Chroma uses for queries, or None when unavailable."""
+    if np is None:
+        return None
+    try:
+        from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+        return DefaultEmbeddingFunction()
+    except Exception as exc:
+        print(f"Query embedder unavailable, semantic answer cache disabled: {exc}")
+        return None
+
+
+@functools.lru_cache(maxsize=256)
+def _embed_cached(normalized: str):
+    embedder = _get_embedder()
+    if embedder is None:
+        return None
+    vector = np.asarray(embedder([normalized])[0], dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else None
+
+
+def _embed(normalized: str):
+    """Return the L2-normalized float32 embedding of a normalized question, or None."""
+    global _embedder_failed
+    if not SEMANTIC_CACHE_ENABLED or _embedder_failed:
+        return None
+    # The first call downloads and loads the model; after a failure the semantic
+    # tier stays off for this process instead of retrying on every question
+    try:
+        return _embed_cached(normalized)
+    except Exception as exc:
+        _embedder_failed = True
+        print(f"Query embedding failed, semantic answer cache disabled: {exc}")
+        return None
+
+
+class _SemanticIndex:
+    """Ring buffer of unit-length question embeddings with their entities and answers."""
+
+    def __init__(self, dim: int):
+        self.vectors = np.zeros((SEMANTIC_CACHE_SIZE, dim), dtype=np.float32)
+        self.entities = [None] * SEMANTIC_CACHE_SIZE
+        self.answers = [None] * SEMANTIC_CACHE_SIZE
+        self.size = 0
+        self.next = 0
+
+    def lookup(self, vector, entities):
+        if not self.size:
+            return None
+        # Rows are unit length, so one matrix-vector product gives every cosine score
+        scores = self.vectors[:self.size] @ vector
+        candidates = np.flatnonzero(scores > SEMANTIC_THRESHOLD)
+        # Best score first; a near-duplicate about another year or country is not a hit
+        for idx in candidates[np.argsort(-scores[candidates])]:
+            if self.entities[idx] == entities:
+                return self.answers[idx]
+        return None
+
+    def add(self, vector, entities, result):
+        self.vectors[self.next] = vector
+        self.entities[self.next] = entities
+        self.answers[self.next] = result
+        self.next = (self.next + 1) % SEMANTIC_CACHE_SIZE
+        self.size = min(self.size + 1, SEMANTIC_CACHE_SIZE)
+
+
+def get_cached_answer(model: str, query: str):
+    """Return the cached `{answer, sources}` dict for a question, or None on a miss."""
+    normalized = normalize_query(query)
+    with _lock:
+        hit = _exact.get((model, normalized))
+        if hit is not None:
+            _exact.move_to_end((model, normalized))
+            return hit
+
+    vector = _embed(normalized)
+    if vector is None:
+        return None
+    with _lock:
+        index = _semantic.get(model)
+        return index.lookup(vector, _entities(query)) if index is not None else None
+
+
+def put(model: str, query: str, result: dict) -> None:
+    """Remember the answer to a question in both tiers (the semantic one when enabled)."""
+    normalized = normalize_query(query)
+    vector = _embed(normalized)
+    with _lock:
+        _exact[(model, normalized)] = result
+        _exact.move_to_end((model, normalized))
+        if len(_exact) > EXACT_CACHE_SIZE:
+            _exact.popitem(last=False)
+
+        if vector is not None:
+            index = _semantic.get(model)
+            if index is None:
+                index = _semantic[model] = _SemanticIndex(vector.shape[0])
+            index.add(vector, _entities(query), result)
+
+
+def clear() -> None:
+    """Drop every cached answer (used by tests)."""
+    global _embedder_failed
+    with _lock:
+        _exact.clear()
+        _semantic.clear()
+        _embedder_failed = False
@@ -12,6 +12,7 @@ CREATE TABLE IF NOT EXISTS "chat_sessions" (
   title TEXT NOT NULL DEFAULT 'New Chat',
   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
   updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  message_count INTEGER NOT NULL DEFAULT 0, /* kept in step with chat_messages by the app */
   CONSTRAINT fk_chat_sessions_user FOREIGN KEY (user_id) REFERENCES user (id)
     ON DELETE CASCADE
 );
@@ -21,7 +22,17 @@ CREATE TABLE IF NOT EXISTS "chat_messages" (
   session_id INTEGER NOT NULL,
   message TEXT NOT NULL,
   is_user BOOLEAN DEFAULT TRUE,
+  status TEXT NOT NULL DEFAULT 'done', /* 'pending' while a background answer is generated */
   timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
   CONSTRAINT fk_chat_messages_session FOREIGN KEY (session_id) REFERENCES chat_sessions (id)
     ON DELETE CASCADE
 );
+
+/* Sidebar listing: WHERE user_id = ? ORDER BY updated_at DESC */
+CREATE INDEX IF NOT EXISTS ix_sess_user_upd ON chat_sessions (user_id, updated_at DESC);
+
+/* Chat history and PDF export: WHERE session_id = ? ORDER BY timestamp */
+CREATE INDEX IF NOT EXISTS ix_msgs_sess_ts ON chat_messages (session_id, timestamp);
+
+/* Paged chat history: WHERE session_id = ? AND id < ? ORDER BY id DESC (or id > ? ORDER BY id) */
+CREATE INDEX IF NOT EXISTS ix_msgs_sess_id ON chat_messages (session_id, id);
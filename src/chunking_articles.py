@@ -1,4 +1,8 @@
+import hashlib
 import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 def load_preprocessed_articles(file_path):
@@ -14,33 +18,46 @@ def load_preprocessed_articles(file_path):
                     articles.append(json.loads(line))
     return articles
 
-def chunk_articles(articles):
-    text_splitter = RecursiveCharacterTextSplitter(
+def _make_splitter():
+    return RecursiveCharacterTextSplitter(
     separators=[". ", "? ", "! "],
     chunk_size=2000,
     chunk_overlap=300,)
 
-    chunked_articles = []
-
-    for idx, article in enumerate(articles):
-        title = article.get("title", "")
-        summary = article.get("summary", "")
-        content = article.get("content", "")
-
-        docs = text_splitter.create_documents(
-            texts=[content],
-            metadatas=[{
-                'article_id': idx,
+def _chunk_shard(shard):
+    # Runs in a worker process: one splitter per shard, plain tuples back (cheap to pickle)
+    text_splitter = _make_splitter()
+    chunks = []
+    for article_id, title, summary, content in shard:
+        for chunk_idx, text in enumerate(text_splitter.split_text(content)):
+            chunks.append((text, {
+                'article_id': article_id,
                 'title': title,
                 'summary': summary,
-            }]
-        )
-    
-        for chunk_idx, doc in enumerate(docs):
-            doc.metadata['chunk_idx'] = chunk_idx
-            #doc.metadata['total_chunks'] = len(docs)
-            chunked_articles.append(doc)
-    
+                'chunk_idx': chunk_idx,
+                # lets rebuild_chroma skip re-embedding chunks whose text is unchanged
+                'content_hash': hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest(),
+            }))
+    return chunks
+
+def chunk_articles(articles):
+    rows = [
+        (idx, article.get("title", ""), article.get("summary", ""), article.get("content", ""))
+        for idx, article in enumerate(articles)
+    ]
+
+    # Contiguous shards, one per core, so the merged output keeps the article order
+    workers = max(1, min(os.cpu_count() or 1, len(rows)))
+    shard_size = -(-len(rows) // workers) if rows else 1
+    shards = [rows[i:i + shard_size] for i in range(0, len(rows), shard_size)]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(_chunk_shard, shards)
+        chunked_articles = [
+            Document(page_content=text, metadata=metadata)
+            for shard_chunks in results
+            for text, metadata in shard_chunks
+        ]
 
     return chunked_articles
 
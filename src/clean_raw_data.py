@@ -1,152 +1,249 @@
 # the raw file contains many columns which need to be displayed
 # this script preprocesses the raw file to keep only the relevant columns
 # and saves the processed file to a new location
+import logging
+import sys
+import numpy as np
 import pandas as pd
 from pathlib import Path
-import random
 
+log = logging.getLogger(__name__)
 
-def delete_pairwise_half_duplicates(df, lang_a, lang_b, seed=42, ru_preserve=False):
+# pyarrow is optional: with it the CSVs are parsed and written by Arrow's C++ reader/writer
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pacsv
+except ImportError:
+    pa = None
+
+# polars is optional: with it a quiet run is one lazy, multi-threaded scan streamed to the output CSV
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+KEEP_LANGUAGES = ['en', 'de', 'ru']
+# Cross-language duplicates to resolve, see delete_pairwise_duplicates
+LANGUAGE_PAIRS = [('en', 'de'), ('en', 'ru'), ('de', 'ru')]
+MIN_CONTENT_LENGTH = 300
+RELEVANT_COLUMNS = ['content', 'contentItemUid', 'contentUrl', 'languageCode', 'summary', 'title', 'uid']
+
+
+def _read_csv(path):
     """
-    Operate on df and for ids that appear in BOTH lang_a and lang_b:
-    - If ru_preserve is False: deterministically split the set of such ids in half
-      and for ids assigned to lang_a remove the lang_b rows, and vice versa.
-    - If ru_preserve is True: assume one of lang_a/lang_b is 'ru' and remove the
-      rows in the non-ru language for ids that appear in both (i.e. keep ru).
+    Read a raw or cleaned CSV with languageCode as a categorical. The article HTML spans
+    several lines inside quoted cells, which pandas' pyarrow engine cannot parse, so Arrow's
+    reader is called directly with newlines_in_values (and empty cells read as missing,
+    like pandas does).
+    """
+    if pa is None:
+        return pd.read_csv(path, dtype={'languageCode': 'category'})
+    table = pacsv.read_csv(
+        path,
+        parse_options=pacsv.ParseOptions(newlines_in_values=True),
+        convert_options=pacsv.ConvertOptions(strings_can_be_null=True),
+    )
+    return table.to_pandas().astype({'languageCode': 'category'})
+
 
-    Returns the modified DataFrame.
+def _uid_sides(uids):
     """
-    # Collect ids present in each language
-    ids_a = set(df.loc[df['languageCode'] == lang_a, 'contentItemUid'].dropna().unique())
-    ids_b = set(df.loc[df['languageCode'] == lang_b, 'contentItemUid'].dropna().unique())
-
-    # Candidates are ids appearing in both languages
-    candidates = list(ids_a & ids_b)
-    total_candidates = len(candidates)
-    print(f'Pairwise candidates for {lang_a}/{lang_b}: {total_candidates}')
-    if total_candidates == 0:
-        return df
+    Deterministic 0/1 per contentItemUid (stable across runs, unlike set order or hash()).
+    pandas' fixed-key SipHash runs over the whole array in C, with no per-id Python call.
+    """
+    return pd.util.hash_array(uids.to_numpy()) & 1
 
-    rnd = random.Random(seed)
-    rnd.shuffle(candidates)
 
-    if ru_preserve:
-        # Find which side is the non-ru language
-        if lang_a == 'ru':
-            non_ru = lang_b
-        elif lang_b == 'ru':
-            non_ru = lang_a
+def delete_pairwise_duplicates(df, language_pairs):
+    """
+    For ids that appear in BOTH languages of a pair, keep only one of the two rows:
+    - If one language of the pair is 'ru', remove the rows in the non-ru language
+      for ids that appear in both (i.e. keep ru).
+    - Otherwise deterministically split such ids in half (by a hash of the id) and
+      for ids assigned to lang_a remove the lang_b rows, and vice versa.
+
+    Language presence per id is computed once for all pairs, and all rows are
+    dropped in a single pass at the end. Returns the modified DataFrame.
+    """
+    presence = df.groupby(['contentItemUid', 'languageCode'], observed=True).size().unstack(fill_value=0).astype(bool)
+
+    # drop[i, j]: remove the row of id presence.index[i] in language presence.columns[j]
+    drop = np.zeros(presence.shape, dtype=bool)
+    for lang_a, lang_b in language_pairs:
+        if lang_a not in presence.columns or lang_b not in presence.columns:
+            log.debug('Pairwise candidates for %s/%s: 0', lang_a, lang_b)
+            continue
+        both = np.flatnonzero(presence[lang_a].to_numpy() & presence[lang_b].to_numpy())
+        log.debug('Pairwise candidates for %s/%s: %d', lang_a, lang_b, len(both))
+        col_a = presence.columns.get_loc(lang_a)
+        col_b = presence.columns.get_loc(lang_b)
+
+        if 'ru' in (lang_a, lang_b):
+            drop[both, col_b if lang_a == 'ru' else col_a] = True
         else:
-            return df
+            keep_a = _uid_sides(presence.index[both]) == 0
+            drop[both[keep_a], col_b] = True
+            drop[both[~keep_a], col_a] = True
 
-        before = len(df)
-        mask_remove = (df['contentItemUid'].isin(candidates)) & (df['languageCode'] == non_ru)
-        df = df[~mask_remove]
-        removed = before - len(df)
-        print(f'RU-preserve: removed {removed} rows from {non_ru}. Line count after: {len(df)}')
+    if not drop.any():
         return df
 
-    # Normal half-split
-    half = total_candidates // 2
-    assigned_a = set(candidates[: half + (total_candidates % 2)])
-    assigned_b = set(candidates[half + (total_candidates % 2):])
+    # Map every row onto the presence table through its (already hashed) index and the
+    # language categories, then look the drop flags up with one fancy-index
+    rows = presence.index.get_indexer(df['contentItemUid'])
+    cols = presence.columns.get_indexer(df['languageCode'])
+    known = (rows >= 0) & (cols >= 0)  # NaN keys never made it into the groupby
+    remove = np.zeros(len(df), dtype=bool)
+    remove[known] = drop[rows[known], cols[known]]
 
     before = len(df)
-    mask_remove = ((df['contentItemUid'].isin(assigned_a) & (df['languageCode'] == lang_b)) |
-                   (df['contentItemUid'].isin(assigned_b) & (df['languageCode'] == lang_a)))
-    df = df[~mask_remove]
-    removed = before - len(df)
-    print(f'Half-split: removed {removed} rows. Line count after: {len(df)}')
+    df = df[~remove]
+    log.debug('Removed %d cross-language duplicate rows. Line count after: %d', before - len(df), len(df))
     return df
 
-def only_keep_languages(df, languages=['en', 'fr', 'de', 'es', 'it']):
-    # Only keep rows with languageCode in the specified languages
-    df = df[df['languageCode'].isin(languages)]
-    print(f"Line count after keeping only specified languages: {len(df)} lines")
-    return df
+def _polars_uid_sides(uids):
+    """_uid_sides for a polars Series, so both engines split the en/de duplicates identically."""
+    return pl.Series(_uid_sides(pd.Index(uids.to_numpy())), dtype=pl.UInt64)
+
+
+def clean_data_lazy(input_path, output_path):
+    """
+    clean_data as a single polars LazyFrame: the language/null/URL/length filters and the
+    cross-language dedup are planned together and streamed into the output CSV.
+    """
+    lf = (
+        pl.scan_csv(input_path, infer_schema_length=10000)
+        .filter(pl.col('languageCode').is_in(KEEP_LANGUAGES))
+        # dropna(how='all') is implied: every remaining row has a language code
+        .filter(pl.col('content').is_not_null() | pl.col('title').is_not_null())
+        .unique(subset=['contentUrl'], keep='first', maintain_order=True)
+        .filter(pl.col('content').str.len_chars() >= MIN_CONTENT_LENGTH)
+    )
+
+    # Which languages each id is present in; null ids find no partner in the join, like the
+    # pandas groupby that drops them
+    presence = lf.group_by('contentItemUid').agg(
+        pl.col('languageCode').eq(lang).any().alias(f'has_{lang}') for lang in KEEP_LANGUAGES
+    )
+    lang = pl.col('languageCode')
+    side = pl.col('contentItemUid').map_batches(_polars_uid_sides, return_dtype=pl.UInt64)
+    drop = pl.lit(False)
+    for lang_a, lang_b in LANGUAGE_PAIRS:
+        both = pl.col(f'has_{lang_a}').fill_null(False) & pl.col(f'has_{lang_b}').fill_null(False)
+        if 'ru' in (lang_a, lang_b):
+            drop = drop | (both & (lang == (lang_b if lang_a == 'ru' else lang_a)))
+        else:
+            drop = drop | (both & (((lang == lang_b) & (side == 0)) | ((lang == lang_a) & (side == 1))))
+
+    (
+        lf.join(presence, on='contentItemUid', how='left', maintain_order='left')
+        .filter(~drop)
+        .select(RELEVANT_COLUMNS)
+        .sink_csv(output_path)
+    )
+    log.info("Cleaned data saved to %s", output_path)
+
 
 def clean_data(input_path):
-    # Get line count (rows) of a csv file or a text file or a json file
+    # The per-step statistics below are only computed when DEBUG logging is on;
+    # value_counts/describe/duplicated each re-scan the whole frame
+    debug = log.isEnabledFor(logging.DEBUG)
     # Inspect the column contentItemUids
     if Path(input_path).suffix == '.csv' or Path(input_path).suffix == '.json' or Path(input_path).suffix == '.txt':
-        line_count = sum(1 for line in open(input_path, 'r', encoding='utf-8'))
-        print(f"Line count: {line_count} lines")
         if Path(input_path).suffix == '.csv':
-            df=pd.read_csv(input_path)
-            print("Column 'contentItemUid' statistics:")
-            print(df['contentItemUid'].describe())
+            output_path = str(Path(input_path).with_suffix('')) + '_cleaned_v6.csv'
+            if pl is not None and not debug:
+                # Same filters without the per-step statistics; the result is read back so
+                # callers get the same DataFrame from either engine
+                clean_data_lazy(input_path, output_path)
+                return _read_csv(output_path)
+            # A handful of language codes: categorical makes the isin/value_counts/groupby
+            # passes integer compares instead of Python string hashing
+            df = _read_csv(input_path)
+            if debug:
+                log.debug("Column 'contentItemUid' statistics:\n%s", df['contentItemUid'].describe())
             # Show line count of df
-            print(f"Line count: {len(df)} lines")
-            # Only keep relevant languages
-            df = only_keep_languages(df, languages=['en', 'de', 'ru'])
-            # Remove empty rows
-            df = df.dropna(how='all')
-            print(f"Line count after removing empty rows: {len(df)} lines")
+            log.debug("Line count: %d lines", len(df))
+
+            # The filters below are combined into one row mask and applied with a single copy.
+            # Only keep relevant languages (rows with a language code are never all-empty,
+            # so this also covers dropna(how='all'))
+            keep = df['languageCode'].isin(KEEP_LANGUAGES).to_numpy()
+            log.debug("Line count after keeping only specified languages: %d lines", keep.sum())
             # Remove missing content or title rows
-            df = df.dropna(subset=['content', 'title'], how='all')
-            print(f"Line count after removing missing content or title rows: {len(df)} lines")
-            # Remove duplicate urls
-            duplicate_urls = df['contentUrl'][df['contentUrl'].duplicated()]
-            print(f"Duplicate URLs: {len(duplicate_urls)}")
-            if len(duplicate_urls) > 0:
-                print(duplicate_urls)
-            df = df.drop_duplicates(subset=['contentUrl'])
-            print(f"Line count after removing duplicate URLs: {len(df)} lines")
-             # Show row count per language
-            print("Row count per language:")
-            print(df['languageCode'].value_counts())
-            # Display duplicate contentItemUids with language code and contentUrl
-            duplicate_ids = df['contentItemUid'][df['contentItemUid'].duplicated()]
-            if len(duplicate_ids) > 0:
-                print("Duplicate contentItemUids with language code and contentUrl:")
-                print(df[df['contentItemUid'].isin(duplicate_ids)][['contentItemUid', 'languageCode', 'contentUrl']])
-            # Display the languagecodes of the duplicate contentItemUids and their distribution
-            if len(duplicate_ids) > 0:
-                print("Language codes of duplicate contentItemUids:")
-                print(df[df['contentItemUid'].isin(duplicate_ids)]['languageCode'].value_counts())
-            # Count the number of duplicate contentItemUids in each language
-            # Show line count of df
-            print(f"Line count: {len(df)} lines")
-            
+            keep = keep & df[['content', 'title']].notna().any(axis=1).to_numpy()
+            log.debug("Line count after removing missing content or title rows: %d lines", keep.sum())
+            # Remove duplicate urls: the first occurrence among the rows kept so far wins
+            url_duplicated = np.zeros(len(df), dtype=bool)
+            url_duplicated[keep] = df['contentUrl'][keep].duplicated().to_numpy()
+            if debug:
+                duplicate_urls = df['contentUrl'][url_duplicated]
+                log.debug("Duplicate URLs: %d", len(duplicate_urls))
+                if len(duplicate_urls) > 0:
+                    log.debug("%s", duplicate_urls)
+            keep = keep & ~url_duplicated
+            log.debug("Line count after removing duplicate URLs: %d lines", keep.sum())
+            if debug:
+                deduped = df[keep]
+                # Show row count per language
+                log.debug("Row count per language:\n%s", deduped['languageCode'].value_counts())
+                # Display duplicate contentItemUids with language code and contentUrl
+                # (keep=False marks every row of a duplicated id, i.e. isin(duplicate ids), in one hash pass)
+                duplicate_rows = deduped[deduped['contentItemUid'].duplicated(keep=False)]
+                if len(duplicate_rows) > 0:
+                    log.debug("Duplicate contentItemUids with language code and contentUrl:\n%s",
+                              duplicate_rows[['contentItemUid', 'languageCode', 'contentUrl']])
+                    # Display the languagecodes of the duplicate contentItemUids and their distribution
+                    log.debug("Language codes of duplicate contentItemUids:\n%s",
+                              duplicate_rows['languageCode'].value_counts())
+
             ### Statistics ###
 
             # Summary statistics of content length
-            df['content_length'] = df['content'].astype(str).apply(len)
-            print("Content length statistics:")
-            print(df['content_length'].describe())
+            content_length = df['content'].str.len()  # NaN content never passes the >= 300 filter
+            if debug:
+                log.debug("Content length statistics:\n%s", content_length[keep].describe())
             # Remove rows with very short content (less than 300 characters)
-            df = df[df['content_length'] >= 300]
-            print(f"Line count after removing short content rows: {len(df)} lines")
+            keep = keep & (content_length >= MIN_CONTENT_LENGTH).to_numpy()
+            log.debug("Line count after removing short content rows: %d lines", keep.sum())
+
+            df = df[keep]
+            if isinstance(df['languageCode'].dtype, pd.CategoricalDtype):
+                df = df.assign(languageCode=df['languageCode'].cat.remove_unused_categories())
             # Summary statistics of the languagecode column
-            print("Language code statistics:")
-            print(df['languageCode'].value_counts())
-     
+            if debug:
+                log.debug("Language code statistics:\n%s", df['languageCode'].value_counts())
+
             # Delete duplicate contentItemUids, keep only one language per contentItemUid
-            language_pairs = [('en', 'de'), ('en', 'ru'), ('de', 'ru')]
-            for lang_a, lang_b in language_pairs:
-                df = delete_pairwise_half_duplicates(df, lang_a, lang_b, seed=42, ru_preserve=('ru' in (lang_a, lang_b)))
+            df = delete_pairwise_duplicates(df, LANGUAGE_PAIRS)
             
-            print("Number of duplicate contentItemUids:")
-            print(df['contentItemUid'].duplicated().sum())
-            print("contentItemIds duplicates:")
-            print(df[df['contentItemUid'].duplicated()][['contentItemUid', 'languageCode', 'contentUrl']])
-            # Show row count per language
-            print("Row count per language after removing duplicate contentItemUids:")
-            print(df['languageCode'].value_counts())
+            if debug:
+                duplicated = df['contentItemUid'].duplicated()
+                log.debug("Number of duplicate contentItemUids: %d", duplicated.sum())
+                log.debug("contentItemIds duplicates:\n%s", df[duplicated][['contentItemUid', 'languageCode', 'contentUrl']])
+                # Show row count per language
+                log.debug("Row count per language after removing duplicate contentItemUids:\n%s",
+                          df['languageCode'].value_counts())
             # Write to a new csv file with suffix '_cleaned.csv'
-            relevant_columns = ['content', 'contentItemUid', 'contentUrl', 'languageCode', 'summary','title', 'uid']
-            df = df[relevant_columns]
-            output_path = str(Path(input_path).with_suffix('')) + '_cleaned_v6.csv'
-            df.to_csv(output_path, index=False)
-            print(f"Cleaned data saved to {output_path}")
+            df = df[RELEVANT_COLUMNS]
+            if pa is not None:
+                # Arrow's CSV writer has no dictionary support, so write language codes as plain strings
+                table = pa.Table.from_pandas(df.astype({'languageCode': str}), preserve_index=False)
+                pacsv.write_csv(table, output_path)
+            else:
+                df.to_csv(output_path, index=False)
+            log.info("Cleaned data saved to %s (%d rows)", output_path, len(df))
             return df
         else:
-            print("File is not a CSV or JSON file.")
+            log.warning("File is not a CSV or JSON file.")
             return
         
 
 
 def main():
+    # Pass --verbose for the per-step statistics
+    logging.basicConfig(level=logging.DEBUG if '--verbose' in sys.argv[1:] else logging.INFO,
+                        format='%(message)s')
     input_path_raw = "data/raw/voxeurop_content.csv"
     clean_data(input_path_raw)
 
@@ -1,6 +1,23 @@
+import html
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 from bs4 import BeautifulSoup
 
+# orjson is optional: without it the NDJSON is written by pandas
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# lxml is optional: without it the HTML is parsed with BeautifulSoup's pure-Python parser
+try:
+    from lxml import html as lh
+except ImportError:
+    lh = None
+
 
 
 def show_column(input_path, column_name: str):
@@ -22,33 +39,82 @@ def extract_title_and_content(input_path, output_path):
     # Select relevant columns
     relevant_columns = ['contentItemUid', 'title', 'content', 'summary']
     df = df[relevant_columns]
-    # Preprocess the text
-    titles = []
-    contents = []
-    summaries = []
-    for title, content, summary in zip(df['title'], df['content'], df['summary']):
-        titles.append(title)
-        contents.append(clean_html_fragment(content))
-        summaries.append(summary)
-
-    # Create a nested dictionary with contentItemUid as key and title and content as inner dictionaries with title as key and content as value
-    # If summary is empty, keep it as empty string
-    nested_dict = {
-        uid: {"title": title, "content": content, "summary": summary if summary else ""}
-        for uid, title, content, summary in zip(df['contentItemUid'], titles, contents, summaries)
-    }
-
-    # Convert the nested dictionary to a DataFrame
-    nested_df = pd.DataFrame.from_dict(nested_dict, orient='index')
+    # One record per contentItemUid, as with the former uid-keyed dict: the last row's
+    # values, kept where the uid first appears (record positions become article ids)
+    first_seen = df['contentItemUid'].drop_duplicates()
+    df = df.drop_duplicates(subset='contentItemUid', keep='last').set_index('contentItemUid').loc[first_seen]
+
+    # Preprocess the text column-wise; if summary is empty, keep it as empty string
+    df = df.assign(
+        content=clean_html_column(df['content']),
+        summary=df['summary'].fillna(""),
+    )
 
     # Save the processed data as NDJSON
-    nested_df.to_json(output_path, orient='records', lines=True, force_ascii=False)
+    nested_df = df[['title', 'content', 'summary']]
+    if orjson is not None:
+        # orjson writes UTF-8 directly; zip over the columns avoids a dict per row from pandas
+        with open(output_path, 'wb') as f:
+            for title, content, summary in zip(nested_df['title'], nested_df['content'], nested_df['summary']):
+                f.write(orjson.dumps({"title": title, "content": content, "summary": summary}))
+                f.write(b"\n")
+    else:
+        nested_df.to_json(output_path, orient='records', lines=True, force_ascii=False)
     print(f"Processed data saved to {output_path}")
     return nested_df
 
-def clean_html_fragment(text):    
-    soup = BeautifulSoup(text, "html.parser")
-    paragraphs = [p.get_text(strip=True).replace(u'\xa0', ' ') for p in soup.find_all("p")]
+# Fast path for plain "<p>...</p>" fragments: one regex scan instead of building a parse tree
+_PARAGRAPH = re.compile(r"<p(?:\s[^>]*)?>(.*?)</p\s*>", re.IGNORECASE | re.DOTALL)
+_P_OPEN = re.compile(r"<p(?:\s[^>]*)?>", re.IGNORECASE)
+_P_CLOSE = re.compile(r"</p\s*>", re.IGNORECASE)
+_TAG = re.compile(r"<[^>]*>")
+# Markup the regex cannot handle like a parser: comments/CDATA, script/style bodies, stray "<",
+# and quoted attribute values containing ">" (which would end _TAG early)
+_NEEDS_PARSER = re.compile(
+    r"""<!|<(?:script|style)\b|<(?![a-zA-Z/])|<[a-zA-Z][^>]*=\s*(?:"[^"]*>|'[^']*>)""",
+    re.IGNORECASE,
+)
+
+# Below this many articles a process pool costs more to start than it saves
+PARALLEL_MIN_ROWS = 1000
+
+def clean_html_column(contents):
+    # HTML parsing holds the GIL, so large corpora are spread over processes
+    if len(contents) < PARALLEL_MIN_ROWS:
+        return contents.map(clean_html_fragment)
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        cleaned = list(executor.map(clean_html_fragment, contents.tolist(), chunksize=512))
+    return pd.Series(cleaned, index=contents.index)
+
+def _clean_simple_fragment(text):
+    """Regex version of clean_html_fragment; None when the markup needs a real parser."""
+    if _NEEDS_PARSER.search(text):
+        return None
+    paragraphs = _PARAGRAPH.findall(text)
+    # Unclosed or nested <p> are repaired differently by a parser, so leave those to it
+    if len(paragraphs) != len(_P_OPEN.findall(text)) or len(paragraphs) != len(_P_CLOSE.findall(text)):
+        return None
+    # Strip and unescape all paragraphs in one pass, then split them apart again
+    body = html.unescape(_TAG.sub("", "\x00".join(paragraphs))).replace(u'\xa0', ' ')
+    return "\n\n".join(p.strip() for p in body.split("\x00")).strip()
+
+def clean_html_fragment(text):
+    if not isinstance(text, str) or not text:
+        return ""
+    if "<" not in text:
+        # Plain text, no markup to parse: keep it as the article body
+        return html.unescape(text).replace(u'\xa0', ' ').strip()
+    simple = _clean_simple_fragment(text)
+    if simple is not None:
+        return simple
+    if lh is None:
+        soup = BeautifulSoup(text, "html.parser")
+        paragraphs = [p.get_text(strip=True).replace(u'\xa0', ' ') for p in soup.find_all("p")]
+        return "\n\n".join(paragraphs).strip()
+
+    # libxml2 parses the fragment in C; <p> texts are joined like before
+    root = lh.fragment_fromstring(text, create_parent="div")
+    paragraphs = [p.text_content().replace(u'\xa0', ' ').strip() for p in root.iter("p")]
     return "\n\n".join(paragraphs).strip()
 
 
@@ -1,37 +1,130 @@
 from __future__ import annotations
-from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional
+import asyncio
 import os
+import threading
+import time
+import weakref
 
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+from mistralai.async_client import MistralAsyncClient
 from mistralai.client import MistralClient
 from mistralai.models.chat_completion import ChatMessage
 
-from src.retriever import retrieve
+from src.retriever import RETRIEVAL_CACHE_TTL, retrieve
 
 # Ensure variables from a local .env are available when running the pipeline directly.
 load_dotenv()
 
-def _build_context(sources: List[Dict[str, Any]]) -> str:
+# Serve the vector search from a FAISS (GPU when available) copy of the collection
+if os.environ.get("USE_FAISS_GPU", "").lower() in {"1", "true", "yes"}:
+    from src.retriever_faiss_gpu import retrieve
+
+# Retrieval results kept per process; the TTL bounds staleness after the collection is rebuilt
+RETRIEVAL_CACHE_SIZE = 256
+
+_retrieval_lock = threading.Lock()
+_retrieval_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+
+def _cached_retrieve(
+    query: str,
+    top_k: int,
+    context_size: int,
+    where: Optional[Dict[str, Any]],
+    mmr_lambda: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """
+    `retrieve` behind a small TTL'd LRU, so a repeated question skips the vector search
+    and the context-window expansion round trips
+    """
+    key = (query, top_k, context_size, repr(where), mmr_lambda)
+    now = time.monotonic()
+    with _retrieval_lock:
+        entry = _retrieval_cache.get(key)
+        if entry is not None and entry[0] > now:
+            _retrieval_cache.move_to_end(key)
+            return list(entry[1])
+
+    hits = retrieve(query=query, top_k=top_k, context_size=context_size, where=where, mmr_lambda=mmr_lambda)
+
+    with _retrieval_lock:
+        _retrieval_cache[key] = (now + RETRIEVAL_CACHE_TTL, hits)
+        _retrieval_cache.move_to_end(key)
+        if len(_retrieval_cache) > RETRIEVAL_CACHE_SIZE:
+            _retrieval_cache.popitem(last=False)
+    return list(hits)
+
+# Character budgets for the prompt context (~4 characters per token): one source may use
+# MAX_SOURCE_CHARS, all of them together MAX_CONTEXT_CHARS (about 12k tokens)
+MAX_SOURCE_CHARS = 16000
+MAX_CONTEXT_CHARS = 48000
+
+
+def _budget_contents(
+    sources: List[Dict[str, Any]],
+    max_source_chars: int = MAX_SOURCE_CHARS,
+    max_context_chars: int = MAX_CONTEXT_CHARS,
+) -> List[Optional[str]]:
+    """
+    The content each source contributes to the context, cut to the per-source budget;
+    None for sources left out once the total budget is spent
+    """
+    contents: List[Optional[str]] = []
+    remaining = max_context_chars
+    for src in sources:
+        if remaining <= 0:
+            contents.append(None)
+            continue
+        content = (src.get("combined_content") or "").strip()[:min(max_source_chars, remaining)]
+        remaining -= len(content)
+        contents.append(content)
+    return contents
+
+
+def _build_context(sources: List[Dict[str, Any]], contents: Optional[List[Optional[str]]] = None) -> str:
     """
     Turn retrieved results into a single context string for the LLM.
-    Each source is one article (with combined chunk window).
+    Each source is one article (with combined chunk window); `contents` are the
+    budgeted texts from `_budget_contents` (the full texts when omitted).
     """
-    blocks: List[str] = []
-    for i, src in enumerate(sources, start=1):
-        title = src.get("title") or "Unknown title"
-        summary = src.get("summary") or ""
+    if contents is None:
+        contents = [(src.get("combined_content") or "").strip() for src in sources]
+
+    # Collect every piece and join once instead of concatenating per source
+    parts: List[str] = []
+    for i, (src, content) in enumerate(zip(sources, contents), start=1):
+        if content is None:
+            break  # over budget; only trailing sources are ever dropped
+        if i > 1:
+            parts.append("\n\n---\n\n")
         # Do not expose internal article IDs in the context header; include title only
-        header = f"[Source {i}] {title}"
+        parts.append(f"[Source {i}] {src.get('title') or 'Unknown title'}")
+        summary = src.get("summary")
         if summary:
-            header += f"\nSummary: {summary}"
-        content = (src.get("combined_content") or "").strip()
-        blocks.append(header + "\n\n" + content)
-    return "\n\n---\n\n".join(blocks)
+            parts.append(f"\nSummary: {summary}")
+        parts.append("\n\n")
+        parts.append(content)
+    return "".join(parts)
+
+
+# One client per API key for the whole process: each wraps an httpx connection pool,
+# so consecutive chat turns reuse the open TLS connection instead of handshaking again.
+@lru_cache(maxsize=4)
+def _get_openai_client(api_key: str) -> OpenAI:
+    return OpenAI(api_key=api_key)
+
+
+@lru_cache(maxsize=4)
+def _get_mistral_client(api_key: str) -> MistralClient:
+    return MistralClient(api_key=api_key)
 
 
 def _call_openai_llm(system_prompt: str, user_prompt: str, model: str, api_key: str) -> str:
-    client = OpenAI(api_key=api_key)
+    client = _get_openai_client(api_key)
     completion = client.chat.completions.create(
         model=model,
         messages=[
@@ -45,7 +138,7 @@ def _call_openai_llm(system_prompt: str, user_prompt: str, model: str, api_key:
 
 
 def _call_mistral_llm(system_prompt: str, user_prompt: str, model: str, api_key: str) -> str:
-    client = MistralClient(api_key=api_key)
+    client = _get_mistral_client(api_key)
     completion = client.chat(
         model=model,
         messages=[
@@ -55,8 +148,10 @@ def _call_mistral_llm(system_prompt: str, user_prompt: str, model: str, api_key:
         temperature=0.2,
     )
 
-    content = completion.choices[0].message.content
+    return _mistral_text(completion.choices[0].message.content)
+
 
+def _mistral_text(content: Any) -> str:
     if isinstance(content, str):
         return content
 
@@ -78,14 +173,92 @@ def _call_mistral_llm(system_prompt: str, user_prompt: str, model: str, api_key:
     return str(content)
 
 
-def generate_rag_response(
-    query: str,
-    sources: List[Dict[str, Any]],
-    api_key: Optional[str] = None,
-    model: Optional[str] = None,
-    provider: str = "openai",
-) -> Dict[str, Any]:
+# Async clients hold connections bound to the event loop that opened them,
+# so they are kept per running loop rather than per process.
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[tuple, Any]]" = weakref.WeakKeyDictionary()
+
+
+def _get_async_client(provider: str, api_key: str):
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get((provider, api_key))
+    if client is None:
+        if provider == "mistral":
+            client = MistralAsyncClient(api_key=api_key)
+        else:
+            client = AsyncOpenAI(api_key=api_key)
+        clients[(provider, api_key)] = client
+    return client
 
+
+async def _acall_openai_llm(system_prompt: str, user_prompt: str, model: str, api_key: str) -> str:
+    client = _get_async_client("openai", api_key)
+    completion = await client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+        temperature=0.2,
+    )
+
+    return completion.choices[0].message.content
+
+
+async def _acall_mistral_llm(system_prompt: str, user_prompt: str, model: str, api_key: str) -> str:
+    client = _get_async_client("mistral", api_key)
+    completion = await client.chat(
+        model=model,
+        messages=[
+            ChatMessage(role="system", content=system_prompt),
+            ChatMessage(role="user", content=user_prompt),
+        ],
+        temperature=0.2,
+    )
+
+    return _mistral_text(completion.choices[0].message.content)
+
+
+def _stream_openai_llm(system_prompt: str, user_prompt: str, model: str, api_key: str) -> Iterator[str]:
+    client = _get_openai_client(api_key)
+    stream = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+        temperature=0.2,
+        stream=True,
+    )
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            yield delta
+
+
+def _stream_mistral_llm(system_prompt: str, user_prompt: str, model: str, api_key: str) -> Iterator[str]:
+    client = _get_mistral_client(api_key)
+    stream = client.chat_stream(
+        model=model,
+        messages=[
+            ChatMessage(role="system", content=system_prompt),
+            ChatMessage(role="user", content=user_prompt),
+        ],
+        temperature=0.2,
+    )
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            yield delta
+
+
+def _resolve_llm(provider: str, model: Optional[str], api_key: Optional[str]):
+    """
+    Validate the provider and fill in the default model and the API key from the environment
+    """
     provider = provider.lower()
     if provider not in {"openai", "mistral"}:
         raise ValueError("provider must be either 'openai' or 'mistral'")
@@ -105,8 +278,14 @@ def generate_rag_response(
             f"No {provider} API key provided. "
             f"Pass api_key=... or set {env_note} env var."
         )
+    return provider, model, api_key
 
-    context = _build_context(sources)
+
+def _build_prompts(query: str, sources: List[Dict[str, Any]], contents: Optional[List[Optional[str]]] = None):
+    """
+    System and user prompt for answering `query` from `sources`
+    """
+    context = _build_context(sources, contents)
 
     system_prompt = """
 You are a careful assistant answering questions about news articles.
@@ -141,15 +320,12 @@ Answer the question strictly based on the CONTEXT above.
 If something is unclear, missing, or not supported by the CONTEXT, state this explicitly in the 'Gaps in the Context' section.
 Follow the structure defined in the system prompt.
 """
+    return system_prompt, user_prompt
 
 
-    if provider == "mistral":
-        answer = _call_mistral_llm(system_prompt, user_prompt, model, api_key)
-    else:
-        answer = _call_openai_llm(system_prompt, user_prompt, model, api_key)
-
+def _source_infos(sources: List[Dict[str, Any]], contents: List[Optional[str]]) -> List[Dict[str, Any]]:
     source_infos = []
-    for i, s in enumerate(sources, start=1):
+    for i, (s, content) in enumerate(zip(sources, contents), start=1):
         # Return only the title and relevance score (no internal article_id),
         # format the score as a percentage string for display purposes,
         # and ensure chunk indices are available for debugging if needed.
@@ -168,16 +344,103 @@ Follow the structure defined in the system prompt.
                 "summary": s.get("summary"),
                 "score": pct_score,
                 "chunk_indices": [c["chunk_idx"] for c in s.get("chunk_details", [])],
+                # Whether the source made it into the prompt, and whether it was cut to fit
+                "in_context": content is not None,
+                "truncated": content is None or len(content) < len((s.get("combined_content") or "").strip()),
             }
         )
 
+    return source_infos
+
+
+def generate_rag_response(
+    query: str,
+    sources: List[Dict[str, Any]],
+    api_key: Optional[str] = None,
+    model: Optional[str] = None,
+    provider: str = "openai",
+    stream: bool = False,
+    max_context_chars: int = MAX_CONTEXT_CHARS,
+    max_source_chars: int = MAX_SOURCE_CHARS,
+) -> Dict[str, Any]:
+    """
+    Ask the LLM to answer `query` from `sources`.
+
+    With stream=True the returned `answer` is an iterator of text chunks
+    (token deltas) instead of the full string; `sources` is filled either way.
+    The context is cut to `max_source_chars` per source and `max_context_chars` overall.
+    """
+    provider, model, api_key = _resolve_llm(provider, model, api_key)
+    contents = _budget_contents(sources, max_source_chars, max_context_chars)
+    system_prompt, user_prompt = _build_prompts(query, sources, contents)
+
+    if stream:
+        llm = _stream_mistral_llm if provider == "mistral" else _stream_openai_llm
+    else:
+        llm = _call_mistral_llm if provider == "mistral" else _call_openai_llm
+    answer = llm(system_prompt, user_prompt, model, api_key)
+
     return {
         "query": query,
         "answer": answer,
-        "sources": source_infos,
+        "sources": _source_infos(sources, contents),
     }
 
 
+async def generate_rag_response_async(
+    query: str,
+    sources: List[Dict[str, Any]],
+    api_key: Optional[str] = None,
+    model: Optional[str] = None,
+    provider: str = "openai",
+    max_context_chars: int = MAX_CONTEXT_CHARS,
+    max_source_chars: int = MAX_SOURCE_CHARS,
+) -> Dict[str, Any]:
+    """
+    Non-streaming `generate_rag_response` that awaits the LLM instead of blocking on it
+    """
+    provider, model, api_key = _resolve_llm(provider, model, api_key)
+    contents = _budget_contents(sources, max_source_chars, max_context_chars)
+    system_prompt, user_prompt = _build_prompts(query, sources, contents)
+
+    llm = _acall_mistral_llm if provider == "mistral" else _acall_openai_llm
+    answer = await llm(system_prompt, user_prompt, model, api_key)
+
+    return {
+        "query": query,
+        "answer": answer,
+        "sources": _source_infos(sources, contents),
+    }
+
+
+def _select_sources(hits: List[Dict[str, Any]], max_articles: int) -> List[Dict[str, Any]]:
+    """
+    The `max_articles` best-scored articles with all of their windows, highest score first
+    """
+    # An article can come back as several records when its hits lie far apart (see
+    # retriever._expand_hits); those are kept together, only exact repeats of a window
+    # (same article and primary chunk) are dropped. sorted() is stable, so equal scores
+    # still rank in retrieval order.
+    ranked = sorted(hits, key=lambda h: float(h.get("score") or 0.0), reverse=True)
+    articles = set()
+    windows = set()
+    top_sources = []
+    for h in ranked:
+        # article_id is a position in the preprocessed file, so 0 is a valid id
+        article = h.get("article_id")
+        if article is None:
+            article = h.get("title") or id(h)
+        if article not in articles:
+            if len(articles) >= max_articles:
+                continue
+            articles.add(article)
+        window = (article, h.get("primary_chunk_idx"))
+        if window not in windows:
+            windows.add(window)
+            top_sources.append(h)
+    return top_sources
+
+
 def complete_rag_pipeline(
     query: str,
     api_key: Optional[str] = None,
@@ -187,61 +450,38 @@ def complete_rag_pipeline(
     where: Optional[Dict[str, Any]] = None,
     model: Optional[str] = None,
     provider: str = "openai",
+    stream: bool = False,
+    mmr_lambda: Optional[float] = None,
 ) -> Dict[str, Any]:
     """
     Full RAG pipeline:
 
-      1) Retrieve top_k candidates from Chroma (each with windowed chunks)
-      2) Take top `max_articles` as context
+      1) Retrieve top_k candidates from Chroma (each with windowed chunks),
+         MMR re-ranked for diversity when `mmr_lambda` is set
+      2) Take the windows of the top `max_articles` articles as context
       3) Call the LLM once to generate an answer
+
+    With stream=True the `answer` is an iterator of text chunks.
     """
     # Step 1: retrieval
-    hits = retrieve(
+    hits = _cached_retrieve(
         query=query,
         top_k=top_k,
         context_size=context_window,
         where=where,
+        mmr_lambda=mmr_lambda,
     )
 
     if not hits:
+        answer = "I could not find any relevant articles in the collection."
         return {
             "query": query,
-            "answer": "I could not find any relevant articles in the collection.",
+            "answer": iter([answer]) if stream else answer,
             "sources": [],
         }
 
     # Step 2: pick a subset of articles for the LLM context
-    # Deduplicate by article_id (or title when article_id is missing). If the
-    # retriever returns multiple chunks from the same article, we want only one
-    # entry per article in the final context. Keep the hit with the highest score.
-    seen: dict = {}
-    ordered_hits: List[Dict[str, Any]] = []
-    for h in hits:
-        aid = h.get("article_id") or h.get("title") or None
-        # Use a composite key for None to preserve uniqueness per-hit
-        key = aid if aid is not None else id(h)
-        if key not in seen:
-            seen[key] = h
-            ordered_hits.append(h)
-        else:
-            # replace with higher-scoring hit if available
-            try:
-                prev_score = float(seen[key].get("score") or 0.0)
-                cur_score = float(h.get("score") or 0.0)
-            except Exception:
-                prev_score = seen[key].get("score") or 0.0
-                cur_score = h.get("score") or 0.0
-            if cur_score > prev_score:
-                seen[key] = h
-                # also update ordered_hits
-                for idx, oh in enumerate(ordered_hits):
-                    if (oh.get("article_id") or oh.get("title") or None) == (h.get("article_id") or h.get("title") or None):
-                        ordered_hits[idx] = h
-                        break
-
-    # Now sort the unique articles by descending score and pick top max_articles
-    ordered_hits.sort(key=lambda x: float(x.get("score") or 0.0), reverse=True)
-    top_sources = ordered_hits[:max_articles]
+    top_sources = _select_sources(hits, max_articles)
 
     # Step 3: generate answer
     result = generate_rag_response(
@@ -250,10 +490,73 @@ def complete_rag_pipeline(
         api_key=api_key,
         model=model,
         provider=provider,
+        stream=stream,
     )
     return result
 
 
+async def complete_rag_pipeline_async(
+    query: str,
+    api_key: Optional[str] = None,
+    top_k: int = 10,
+    context_window: int = 2,
+    max_articles: int = 2,
+    where: Optional[Dict[str, Any]] = None,
+    model: Optional[str] = None,
+    provider: str = "openai",
+    mmr_lambda: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Non-streaming `complete_rag_pipeline` as a coroutine, so several questions can be
+    answered concurrently with `asyncio.gather`. Retrieval runs in a worker thread.
+    """
+    hits = await asyncio.to_thread(
+        _cached_retrieve,
+        query=query,
+        top_k=top_k,
+        context_size=context_window,
+        where=where,
+        mmr_lambda=mmr_lambda,
+    )
+
+    if not hits:
+        return {
+            "query": query,
+            "answer": "I could not find any relevant articles in the collection.",
+            "sources": [],
+        }
+
+    return await generate_rag_response_async(
+        query=query,
+        sources=_select_sources(hits, max_articles),
+        api_key=api_key,
+        model=model,
+        provider=provider,
+    )
+
+
+# Concurrent LLM requests per batch; keeps a burst of questions under the provider rate limits
+BATCH_CONCURRENCY = 8
+
+
+async def complete_rag_pipeline_batch(
+    queries: List[str],
+    max_concurrency: int = BATCH_CONCURRENCY,
+    **kwargs: Any,
+) -> List[Dict[str, Any]]:
+    """
+    Answer several questions concurrently; results come back in the order of `queries`.
+    Keyword arguments are passed on to `complete_rag_pipeline_async`.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _one(query: str) -> Dict[str, Any]:
+        async with semaphore:
+            return await complete_rag_pipeline_async(query=query, **kwargs)
+
+    return await asyncio.gather(*(_one(q) for q in queries))
+
+
 # test
 if __name__ == "__main__":
     test_queries = [
@@ -274,21 +577,22 @@ if __name__ == "__main__":
 
     print(f"Using provider={provider}")
 
-    for q in test_queries:
+    # The LLM calls are network-bound, so issue them all at once
+    outputs = asyncio.run(complete_rag_pipeline_batch(
+        test_queries,
+        api_key=api_key,
+        top_k=10,
+        context_window=2,
+        max_articles=2,
+        where=None,
+        provider=provider,
+    ))
+
+    for q, out in zip(test_queries, outputs):
         print("\n" + "=" * 80)
         print("QUERY:", q)
         print("=" * 80)
 
-        out = complete_rag_pipeline(
-            query=q,
-            api_key=api_key,
-            top_k=10,
-            context_window=2,
-            max_articles=2,
-            where=None,
-            provider=provider,
-        )
-
         print("\nANSWER:\n", out["answer"])
         print("\nSOURCES:")
         for s in out["sources"]:
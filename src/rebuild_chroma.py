@@ -1,33 +1,94 @@
 from __future__ import annotations
+import hashlib
 import json
 import chromadb
 from chromadb.utils import embedding_functions
+from sentence_transformers import SentenceTransformer
+
+# ijson is optional: with it the chunked JSON is parsed item by item instead of
+# materializing the whole document tree next to the id/doc/metadata lists
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
 from src.chroma_config import get_chroma_config
 
+# Value types Chroma stores as-is; anything else (lists/dicts/objects) is stringified.
+# Metadata comes from JSON, so an exact-type set lookup replaces the isinstance tuple walk.
+_PRIMITIVES = frozenset((str, int, float, bool))
+
 def _sanitize_metadata(meta: dict | None) -> dict:
 
     if not isinstance(meta, dict):
         return {}
-    out: dict = {}
-    for k, v in meta.items():
-        if v is None:
-            continue
-        if isinstance(v, (str, int, float, bool)):
-            out[k] = v
-        else:
-            # fallback: stringify lists/dicts/objects
-            try:
-                out[k] = str(v)
-            except Exception:
-                continue
-    return out
+    return {
+        k: v if type(v) in _PRIMITIVES else str(v)
+        for k, v in meta.items()
+        if v is not None
+    }
+
+def _content_hash(text: str) -> str:
+    """Same digest chunking_articles stores as metadata["content_hash"]."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+def _existing_hashes(col) -> dict:
+    """Map every id already in the collection to its stored content hash."""
+    hashes: dict = {}
+    page_size = 5000
+    offset = 0
+    while True:
+        batch = col.get(include=["metadatas"], limit=page_size, offset=offset)
+        batch_ids = batch.get("ids", [])
+        if not batch_ids:
+            break
+        for cid, meta in zip(batch_ids, batch["metadatas"]):
+            hashes[cid] = (meta or {}).get("content_hash")
+        if len(batch_ids) < page_size:
+            break
+        offset += page_size
+    return hashes
+
+def _chunk_id(meta: dict, position: int) -> str:
+    """
+    Record id from the chunk's article_id and chunk_idx, so re-chunking one article leaves
+    the ids (and stored embeddings) of every other article untouched. article_id is the
+    article's position in the preprocessed file, so inserting or removing an article
+    still shifts the ids of the articles after it.
+    """
+    if "article_id" in meta and "chunk_idx" in meta:
+        return f"{meta['article_id']}:{meta['chunk_idx']}"
+    return f"chunk_{position}"
+
+def _iter_chunks(f):
+    """Yield the items of the chunked JSON array, streamed when ijson is installed."""
+    if ijson is None:
+        return iter(json.load(f))
+    # use_float keeps numbers as float instead of Decimal, like json.load
+    return ijson.items(f, "item", use_float=True)
+
+def _device() -> str:
+    """Encode on a CUDA GPU or Apple-Silicon MPS when torch sees one."""
+    try:
+        import torch
+    except ImportError:
+        return "cpu"
+    if torch.cuda.is_available():
+        return "cuda"
+    mps = getattr(torch.backends, "mps", None)
+    return "mps" if mps is not None and mps.is_available() else "cpu"
 
 def main() -> None:
-    """Rebuild the Chroma collection from the chunked JSON file."""
+    """Sync the Chroma collection with the chunked JSON file, re-embedding only changed chunks."""
 
+    model_name = "all-MiniLM-L6-v2"
+    # Unit-length embeddings make inner product rank exactly like cosine, without the
+    # per-distance normalization HNSW does in "cosine" space
+    device = _device()
     ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-        model_name="all-MiniLM-L6-v2"
+        model_name=model_name,
+        device=device,
+        normalize_embeddings=True,
     )
 
     CONFIG = get_chroma_config()
@@ -35,32 +96,70 @@ def main() -> None:
     client = chromadb.PersistentClient(path=CONFIG.path)
     col = client.get_or_create_collection(
         name=CONFIG.collection,
-        metadata={"hnsw:space": "cosine"},
+        metadata={"hnsw:space": "ip"},
         embedding_function=ef,
     )
+    # The distance space is fixed when a collection is created; older "cosine"
+    # collections are rebuilt from scratch once
+    if (col.metadata or {}).get("hnsw:space") != "ip":
+        client.delete_collection(CONFIG.collection)
+        col = client.create_collection(
+            name=CONFIG.collection,
+            metadata={"hnsw:space": "ip"},
+            embedding_function=ef,
+        )
 
-    with open(CONFIG.chunked_json, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    # Expect items like: {"document": "...", "metadata": {"article_id": ..., "chunk_idx": ...}}
-    BATCH = 512
+    # Expect items like: {"document": "...", "metadata": {"article_id": ..., "chunk_idx": ..., "content_hash": ...}}
     ids, docs, metas = [], [], []
-    for i, item in enumerate(data):
-        doc = item.get("document") or ""
-        if not isinstance(doc, str) or not doc.strip():
-            continue  # skip empty docs
-        ids.append(item.get("id") or f"chunk_{i}")
-        docs.append(doc)
-        metas.append(_sanitize_metadata(item.get("metadata", {})))
-
-        if len(ids) == BATCH:
-            col.add(ids=ids, documents=docs, metadatas=metas)
-            ids, docs, metas = [], [], []
-
-    if ids:
-        col.add(ids=ids, documents=docs, metadatas=metas)
-
-    print(f"Rebuilt Chroma collection successfully. Count = {col.count()}")
+    with open(CONFIG.chunked_json, "rb") as f:
+        for i, item in enumerate(_iter_chunks(f)):
+            doc = item.get("document") or ""
+            if not isinstance(doc, str) or not doc.strip():
+                continue  # skip empty docs
+            meta = _sanitize_metadata(item.get("metadata", {}))
+            meta.setdefault("content_hash", _content_hash(doc))
+            ids.append(item.get("id") or _chunk_id(meta, i))
+            docs.append(doc)
+            metas.append(meta)
+
+    # Only chunks that are new or whose text changed need an embedding
+    existing = _existing_hashes(col)
+    changed = [i for i, (cid, meta) in enumerate(zip(ids, metas)) if existing.get(cid) != meta["content_hash"]]
+    stale = list(existing.keys() - set(ids))
+
+    # Chroma caps the number of records per call
+    BATCH = min(5000, client.get_max_batch_size())
+    for start in range(0, len(stale), BATCH):
+        col.delete(ids=stale[start:start + BATCH])
+
+    if changed:
+        # Embed in large batches (same model as `ef`, so queries stay compatible)
+        # and hand the vectors to Chroma, which then skips its own embedding call.
+        # Reuse the model the embedding function already loaded rather than a second copy
+        embedder = getattr(ef, "_model", None)
+        if not isinstance(embedder, SentenceTransformer):
+            embedder = SentenceTransformer(model_name, device=device)
+        embeddings = embedder.encode(
+            [docs[i] for i in changed],
+            batch_size=512,
+            show_progress_bar=True,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        )
+
+        for start in range(0, len(changed), BATCH):
+            part = changed[start:start + BATCH]
+            col.upsert(
+                ids=[ids[i] for i in part],
+                documents=[docs[i] for i in part],
+                metadatas=[metas[i] for i in part],
+                embeddings=embeddings[start:start + BATCH].tolist(),
+            )
+
+    print(
+        f"Rebuilt Chroma collection successfully. Embedded {len(changed)}, "
+        f"unchanged {len(ids) - len(changed)}, removed {len(stale)}. Count = {col.count()}"
+    )
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
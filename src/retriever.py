@@ -1,79 +1,184 @@
 from __future__ import annotations
-from typing import Any, Dict, List, Optional
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from functools import lru_cache
+from operator import itemgetter
+from typing import Any, Dict, Iterable, List, Optional
+import threading
+import time
 import chromadb
+from chromadb.errors import NotFoundError
+import numpy as np
 
 from src.chroma_config import get_chroma_config
 
 CONFIG = get_chroma_config()
 
+# Sorted chunk lists of recently expanded articles. A rebuild runs in another process, so
+# entries expire after RETRIEVAL_CACHE_TTL (shared with rag_pipeline's retrieval cache)
+ARTICLE_CACHE_SIZE = 1024
+RETRIEVAL_CACHE_TTL = 300  # seconds
 
+_article_cache_lock = threading.Lock()
+_article_cache: "OrderedDict[Any, tuple]" = OrderedDict()
+
+
+@lru_cache(maxsize=1)
 def _get_collection() -> chromadb.api.models.Collection.Collection:
     """
-    Connect to the existing persistent Chroma DB and open the target collection
+    Connect to the existing persistent Chroma DB and open the target collection.
+    Opened once per process; the client is safe to share between threads for queries.
     """
     client = chromadb.PersistentClient(path=CONFIG.path)
     collection = client.get_or_create_collection(
         name=CONFIG.collection,
-        metadata={"hnsw:space": "cosine"}
+        metadata={"hnsw:space": "ip"}  # embeddings are unit length (see rebuild_chroma)
     )
     return collection
 
 
+def _collection_call(method: str, **kwargs: Any) -> Dict[str, Any]:
+    """
+    Call a read method on the cached collection. rebuild_chroma may delete and recreate
+    the collection under a running process; the stale handle then raises NotFoundError,
+    so the collection is reopened and the call retried once.
+    """
+    try:
+        return getattr(_get_collection(), method)(**kwargs)
+    except NotFoundError:
+        _get_collection.cache_clear()
+        return getattr(_get_collection(), method)(**kwargs)
+
+
 def _to_results(res: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
     Convert Chroma query response to a flat list with id, text, metadata, and similarity
     """
     docs = res.get("documents", [[]])[0]
-    metas = res.get("metadatas", [[]])[0]
+    metas = res.get("metadatas", [[]])[0] or []
     ids = res.get("ids", [[]])[0]
-    dists = res.get("distances", [[]])[0] or []
+    dists = res.get("distances", [[]])[0]
+
+    # ip distance is 1 - dot product, i.e. 1 - cosine for unit vectors
+    if dists is not None and len(dists):
+        sims = (1.0 - np.asarray(dists, dtype=np.float64)).tolist()
+    else:
+        sims = [None] * len(docs)
+    # Missing metadata entries come back as {}
+    metas = list(metas) + [{}] * (len(docs) - len(metas))
+
+    return [
+        {"id": cid, "text": doc, "metadata": meta, "score": sim}
+        for cid, doc, meta, sim in zip(ids, docs, metas, sims)
+    ]
 
-    sims = [1.0 - float(d) for d in dists] if dists else [None] * len(docs)
 
-    out: List[Dict[str, Any]] = []
-    for i in range(len(docs)):
-        out.append({
-            "id": ids[i],
-            "text": docs[i],
-            "metadata": metas[i] if metas and i < len(metas) else {},
-            "score": sims[i],
-        })
-    return out
+# Candidate pool MMR re-ranks, as a multiple of top_k
+MMR_FETCH_FACTOR = 4
+
+
+def _mmr(
+    query_sims: np.ndarray,
+    cand_vecs: np.ndarray,
+    k: int,
+    lambda_mult: float = 0.5,
+) -> List[int]:
+    """
+    Maximal marginal relevance: greedily pick k candidates, trading similarity to the query
+    (`query_sims`) against similarity to the candidates already picked. All pairwise
+    similarities come from one matrix product; rows of `cand_vecs` are unit length.
+    """
+    n = len(query_sims)
+    if n == 0 or k <= 0:
+        return []
+    cand_sims = cand_vecs @ cand_vecs.T
+
+    picked = [int(np.argmax(query_sims))]
+    max_sim = cand_sims[picked[0]].copy()
+    while len(picked) < min(k, n):
+        scores = lambda_mult * query_sims - (1.0 - lambda_mult) * max_sim
+        scores[picked] = -np.inf
+        best = int(np.argmax(scores))
+        picked.append(best)
+        np.maximum(max_sim, cand_sims[best], out=max_sim)
+    return picked
 
 
 def chroma_retrieve(
     query: str,
     top_k: int = 10,
     where: Optional[Dict[str, Any]] = None,
+    mmr_lambda: Optional[float] = None,
 ) -> List[Dict[str, Any]]:
     """
-    Semantic retrieval from Chroma
+    Semantic retrieval from Chroma. With `mmr_lambda` set, MMR_FETCH_FACTOR * top_k
+    candidates are fetched and re-ranked for diversity (1.0 = pure relevance).
     """
-    col = _get_collection()
-    res = col.query(
+    if mmr_lambda is None:
+        res = _collection_call(
+            "query",
+            query_texts=[query],
+            n_results=top_k,
+            where=where,
+            include=["documents", "metadatas", "distances"],
+        )
+        return _to_results(res)
+
+    res = _collection_call(
+        "query",
         query_texts=[query],
-        n_results=top_k,
+        n_results=top_k * MMR_FETCH_FACTOR,
         where=where,
-        include=["documents", "metadatas", "distances"],
+        include=["documents", "metadatas", "distances", "embeddings"],
     )
-    return _to_results(res)
+    hits = _to_results(res)
+    if not hits:
+        return hits
+    # Stored embeddings are unit length, so the ip score is already the query cosine
+    query_sims = np.array([h["score"] for h in hits], dtype=np.float32)
+    cand_vecs = np.asarray(res["embeddings"][0], dtype=np.float32)
+    return [hits[i] for i in _mmr(query_sims, cand_vecs, top_k, mmr_lambda)]
 
 
 # Parent expansion (surrounding chunks)
-def _fetch_article_chunks(
-    article_id: Any,
-) -> List[Dict[str, Any]]:
+_CHUNK_IDX = itemgetter("chunk_idx")
+
+
+def _parse_chunk_idx(meta: Dict[str, Any]) -> int:
+    try:
+        return int(meta.get("chunk_idx", -1))
+    except Exception:
+        return -1
+
+
+def _fetch_many_article_chunks(
+    article_ids: Iterable[Any],
+) -> Dict[Any, List[Dict[str, Any]]]:
     """
-    Pull ALL chunks for an article_id from Chroma once, sort by chunk_idx
+    Pull ALL chunks of several articles from Chroma with one paged `$in` query,
+    grouped by article_id and sorted by chunk_idx. Articles fetched recently are
+    served from an in-process TTL'd LRU; the returned lists are shared, do not modify them.
     """
-    col = _get_collection()
-
-    collected: List[Dict[str, Any]] = []
+    unique_ids = list(dict.fromkeys(article_ids))
+    found: Dict[Any, List[Dict[str, Any]]] = {}
+    now = time.monotonic()
+    with _article_cache_lock:
+        for aid in unique_ids:
+            entry = _article_cache.get(aid)
+            if entry is not None and entry[0] > now:
+                _article_cache.move_to_end(aid)
+                found[aid] = entry[1]
+    missing = [aid for aid in unique_ids if aid not in found]
+    if not missing:
+        return found
+
+    grouped: Dict[Any, List[Dict[str, Any]]] = {aid: [] for aid in missing}
     page = 0
     page_size = 500
     while True:
-        batch = col.get(
-            where={"article_id": article_id},
+        batch = _collection_call(
+            "get",
+            where={"article_id": {"$in": missing}},
             include=["documents", "metadatas"],
             limit=page_size,
             offset=page * page_size,
@@ -84,32 +189,59 @@ def _fetch_article_chunks(
         docs = batch["documents"]
         metas = batch["metadatas"]
         for i in range(len(ids)):
-            collected.append({
+            meta = metas[i] if metas and i < len(metas) else {}
+            grouped.setdefault(meta.get("article_id"), []).append({
                 "id": ids[i],
                 "text": docs[i],
-                "metadata": metas[i] if metas and i < len(metas) else {},
+                "metadata": meta,
+                "chunk_idx": _parse_chunk_idx(meta),
             })
         if len(ids) < page_size:
             break
         page += 1
 
-    # Sort by chunk_idx if present
-    def _ck(m: Dict[str, Any]) -> int:
-        try:
-            return int(m["metadata"].get("chunk_idx", 0))
-        except Exception:
-            return 0
+    with _article_cache_lock:
+        for aid, chunks in grouped.items():
+            chunks.sort(key=_CHUNK_IDX)
+            _article_cache[aid] = (now + RETRIEVAL_CACHE_TTL, chunks)
+            _article_cache.move_to_end(aid)
+        while len(_article_cache) > ARTICLE_CACHE_SIZE:
+            _article_cache.popitem(last=False)
+
+    found.update(grouped)
+    return found
+
+
+def clear_cache() -> None:
+    """
+    Forget the collection handle and the cached article chunks at once, rather than
+    waiting for them to expire (e.g. after re-ingesting in this same process)
+    """
+    _get_collection.cache_clear()
+    with _article_cache_lock:
+        _article_cache.clear()
 
-    collected.sort(key=_ck)
-    return collected
+
+def _fetch_article_chunks(
+    article_id: Any,
+) -> List[Dict[str, Any]]:
+    """
+    Pull ALL chunks for an article_id from Chroma once, sort by chunk_idx
+    """
+    return _fetch_many_article_chunks([article_id])[article_id]
 
 
 def _expand_around_primary(
     primary_hit: Dict[str, Any],
     context_size: int = 2,
+    article_chunks: Optional[List[Dict[str, Any]]] = None,
+    other_centers: Iterable[int] = (),
 ) -> Optional[Dict[str, Any]]:
     """
-    Build a combined context around the primary chunk using article_id & chunk_idx
+    Build a combined context around the primary chunk using article_id & chunk_idx.
+    `article_chunks` may be passed in when they were already fetched for several hits.
+    Windows around `other_centers` (further hits in the same article) are merged in
+    when they overlap or touch the primary's window.
     """
     meta = primary_hit.get("metadata", {}) or {}
     if "article_id" not in meta or "chunk_idx" not in meta:
@@ -118,32 +250,40 @@ def _expand_around_primary(
     article_id = meta["article_id"]
     center_idx = int(meta["chunk_idx"])
 
-    article_chunks = _fetch_article_chunks(article_id)
+    if article_chunks is None:
+        article_chunks = _fetch_article_chunks(article_id)
     if not article_chunks:
         return None
 
     # Build a window [center - context_size, center + context_size]
     start = max(0, center_idx - context_size)
     end = center_idx + context_size
-
-    window: List[Dict[str, Any]] = []
-    for ch in article_chunks:
-        ck = int(ch["metadata"].get("chunk_idx", -1))
-        if start <= ck <= end:
-            window.append({
-                "chunk_idx": ck,
-                "article_id": article_id,
-                "title": ch["metadata"].get("title"),
-                "summary": ch["metadata"].get("summary"),
-                "chunk_id": ch["id"],
-                "content": ch["text"],
-                "is_primary": (ck == center_idx),
-            })
+    # Grow it by every other hit's window that connects to it; sorted by distance so
+    # a chain of adjacent hits is absorbed in one pass
+    for other in sorted(other_centers, key=lambda c: abs(c - center_idx)):
+        o_start, o_end = max(0, other - context_size), other + context_size
+        if o_start <= end + 1 and o_end >= start - 1:
+            start, end = min(start, o_start), max(end, o_end)
+
+    # Chunks are sorted by chunk_idx, so the window is one contiguous slice
+    lo = bisect_left(article_chunks, start, key=_CHUNK_IDX)
+    hi = bisect_right(article_chunks, end, key=_CHUNK_IDX)
+    window: List[Dict[str, Any]] = [
+        {
+            "chunk_idx": ch["chunk_idx"],
+            "article_id": article_id,
+            "title": ch["metadata"].get("title"),
+            "summary": ch["metadata"].get("summary"),
+            "chunk_id": ch["id"],
+            "content": ch["text"],
+            "is_primary": (ch["chunk_idx"] == center_idx),
+        }
+        for ch in article_chunks[lo:hi]
+    ]
 
     if not window:
         return None
 
-    window.sort(key=lambda x: x["chunk_idx"])
     combined = "\n\n".join(w["content"] for w in window)
 
     # Carry a score from the primary (if present)
@@ -161,25 +301,72 @@ def _expand_around_primary(
     }
 
 
+def _expand_hits(
+    hits: List[Dict[str, Any]],
+    context_size: int = 2,
+) -> List[Dict[str, Any]]:
+    """
+    Parent-expand the hits, fetching the chunks of all their articles in one round trip.
+    Hits of one article whose windows overlap or touch become one record; windows that
+    stay apart are separate records, ordered by their highest-ranked hit.
+    """
+    article_ids = [
+        meta["article_id"]
+        for meta in ((h.get("metadata") or {}) for h in hits)
+        if "article_id" in meta and "chunk_idx" in meta
+    ]
+    chunks_by_article = _fetch_many_article_chunks(article_ids)
+
+    by_article: Dict[Any, List[tuple]] = {}
+    for rank, hit in enumerate(hits):
+        meta = hit.get("metadata") or {}
+        if "article_id" in meta and "chunk_idx" in meta:
+            by_article.setdefault(meta["article_id"], []).append((int(meta["chunk_idx"]), rank, hit))
+
+    # Group each article's hits into spans of connected windows, walking them by chunk_idx
+    spans: List[List[tuple]] = []
+    for article_hits in by_article.values():
+        article_hits.sort(key=itemgetter(0))
+        end = None
+        for center, rank, hit in article_hits:
+            if end is None or center - context_size > end + 1:
+                spans.append([])
+            spans[-1].append((center, rank, hit))
+            end = center + context_size
+
+    expanded: List[tuple] = []
+    for span in spans:
+        # The best-scored hit is the primary; the others widen its window
+        center, rank, primary = max(
+            span,
+            key=lambda m: m[2]["score"] if m[2].get("score") is not None else float("-inf"),
+        )
+        aid = primary["metadata"]["article_id"]
+        exp = _expand_around_primary(
+            primary,
+            context_size=context_size,
+            article_chunks=chunks_by_article.get(aid, []),
+            other_centers=[c for c, _, h in span if h is not primary],
+        )
+        if exp:
+            expanded.append((min(r for _, r, _ in span), exp))
+    expanded.sort(key=itemgetter(0))
+    return [exp for _, exp in expanded]
+
+
 # API
 def retrieve(
     query: str,
     top_k: int = 5,
     context_size: int = 2,
     where: Optional[Dict[str, Any]] = None,
+    mmr_lambda: Optional[float] = None,
 ) -> List[Dict[str, Any]]:
     """
-    Returns parent-expanded results
+    Returns parent-expanded results (MMR re-ranked when `mmr_lambda` is set)
     """
-    hits = chroma_retrieve(query, top_k=top_k, where=where)
-
-    expanded: List[Dict[str, Any]] = []
-    for hit in hits:
-        exp = _expand_around_primary(hit, context_size=context_size)
-        if exp:
-            expanded.append(exp)
-
-    return expanded
+    hits = chroma_retrieve(query, top_k=top_k, where=where, mmr_lambda=mmr_lambda)
+    return _expand_hits(hits, context_size=context_size)
 
 
 def print_retrieval_results(results: List[Dict[str, Any]], max_content_length: int = 200):
@@ -0,0 +1,182 @@
+from __future__ import annotations
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence
+import os
+import threading
+import time
+import faiss
+import numpy as np
+from chromadb.utils import embedding_functions
+
+from src.retriever import _collection_call, _expand_hits, chroma_retrieve
+from src.retriever import clear_cache as _clear_chroma_cache
+
+# IVF lists probed per query; higher is more accurate and slower
+NPROBE = 32
+
+# How often (seconds) a query re-reads the collection size; a changed count means the
+# collection was re-ingested, and the next query rebuilds the index from it
+INDEX_CHECK_INTERVAL = 30
+
+# How the vectors are stored in the IVF lists: fp16 halves and int8 quarters the index RAM
+# (and the bandwidth each probe scans) for a recall loss well under 1% on unit vectors
+_QUANTIZERS = {
+    "fp32": None,
+    "fp16": faiss.ScalarQuantizer.QT_fp16,
+    "int8": faiss.ScalarQuantizer.QT_8bit,
+}
+FAISS_QUANTIZATION = os.environ.get("FAISS_QUANTIZATION", "fp16").lower()
+
+
+class _FaissIndex:
+    """FAISS copy of the Chroma collection, plus row -> (id, text, metadata) lookups."""
+
+    def __init__(self, index: faiss.Index, ids: List[str], docs: List[str], metas: List[Dict[str, Any]]):
+        self.index = index
+        self.ids = ids
+        self.docs = docs
+        self.metas = metas
+
+
+@lru_cache(maxsize=1)
+def _get_embedder() -> embedding_functions.EmbeddingFunction:
+    """Same embedding function the Chroma collection is queried with."""
+    return embedding_functions.DefaultEmbeddingFunction()
+
+
+_index_check_lock = threading.Lock()
+_index_count: Optional[int] = None
+_index_checked_at = float("-inf")
+
+
+def _get_index() -> _FaissIndex:
+    """
+    Index for the collection as it is now: cached per collection count, which is
+    re-read at most every INDEX_CHECK_INTERVAL seconds
+    """
+    global _index_count, _index_checked_at
+    with _index_check_lock:
+        now = time.monotonic()
+        if _index_count is None or now - _index_checked_at >= INDEX_CHECK_INTERVAL:
+            _index_count = _collection_call("count")
+            _index_checked_at = now
+        count = _index_count
+    return _build_index(count)
+
+
+@lru_cache(maxsize=1)
+def _build_index(count: int) -> _FaissIndex:
+    """
+    Load every embedding out of Chroma and build an IVF index (on GPU 0 when available),
+    storing the vectors as FAISS_QUANTIZATION; `count` only keys the cache
+    """
+    ids: List[str] = []
+    docs: List[str] = []
+    metas: List[Dict[str, Any]] = []
+    vectors: List[Any] = []
+    page_size = 5000
+    offset = 0
+    while True:
+        batch = _collection_call(
+            "get",
+            include=["embeddings", "documents", "metadatas"],
+            limit=page_size,
+            offset=offset,
+        )
+        batch_ids = batch.get("ids", [])
+        if not batch_ids:
+            break
+        ids.extend(batch_ids)
+        docs.extend(batch["documents"])
+        metas.extend(m or {} for m in batch["metadatas"])
+        vectors.extend(batch["embeddings"])
+        if len(batch_ids) < page_size:
+            break
+        offset += page_size
+
+    if not ids:
+        raise RuntimeError("Chroma collection is empty; nothing to load into FAISS")
+
+    emb = np.asarray(vectors, dtype=np.float32)
+    # Stored embeddings are unit length already; normalizing again is cheap and keeps old collections correct
+    faiss.normalize_L2(emb)
+    n, d = emb.shape
+
+    # ~4*sqrt(N) lists (capped at 4096) keeps lists reasonably full on small collections
+    nlist = max(1, min(4096, int(4 * np.sqrt(n)), n))
+    quantizer = faiss.IndexFlatIP(d)
+    if FAISS_QUANTIZATION not in _QUANTIZERS:
+        raise ValueError(f"FAISS_QUANTIZATION must be one of {sorted(_QUANTIZERS)}")
+    qtype = _QUANTIZERS[FAISS_QUANTIZATION]
+    if qtype is None:
+        index = faiss.IndexIVFFlat(quantizer, d, nlist, faiss.METRIC_INNER_PRODUCT)
+    else:
+        index = faiss.IndexIVFScalarQuantizer(quantizer, d, nlist, qtype, faiss.METRIC_INNER_PRODUCT)
+
+    rng = np.random.default_rng(0)
+    sample = emb[rng.choice(n, size=min(n, nlist * 64), replace=False)]
+    index.train(sample)
+    index.add(emb)
+    index.nprobe = min(NPROBE, nlist)
+
+    if faiss.get_num_gpus() > 0:
+        index = faiss.index_cpu_to_gpu(faiss.StandardGpuResources(), 0, index)
+
+    return _FaissIndex(index, ids, docs, metas)
+
+
+def clear_cache() -> None:
+    """
+    Drop the FAISS copy along with retriever's caches, so the next query rebuilds it
+    (e.g. after re-ingesting a collection of the same size in this process)
+    """
+    global _index_count
+    with _index_check_lock:
+        _index_count = None
+    _build_index.cache_clear()
+    _clear_chroma_cache()
+
+
+def search(query_embs: Sequence[Sequence[float]], top_k: int = 10) -> List[List[Dict[str, Any]]]:
+    """
+    Batched nearest-neighbour search; returns one hit list per query embedding
+    """
+    idx = _get_index()
+    q = np.asarray(query_embs, dtype=np.float32).reshape(len(query_embs), -1)
+    faiss.normalize_L2(q)
+    scores, rows = idx.index.search(q, top_k)
+
+    out: List[List[Dict[str, Any]]] = []
+    for row_scores, row_ids in zip(scores, rows):
+        hits = []
+        for score, r in zip(row_scores, row_ids):
+            if r < 0:
+                continue  # fewer than top_k vectors in the probed lists
+            hits.append({
+                "id": idx.ids[r],
+                "text": idx.docs[r],
+                "metadata": idx.metas[r],
+                "score": float(score),
+            })
+        out.append(hits)
+    return out
+
+
+def retrieve(
+    query: str,
+    top_k: int = 5,
+    context_size: int = 2,
+    where: Optional[Dict[str, Any]] = None,
+    mmr_lambda: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Same contract as `src.retriever.retrieve`, with the vector search served by FAISS
+    """
+    if where is not None or mmr_lambda is not None:
+        # Metadata filters are only supported by Chroma itself, and the quantized
+        # index does not hand back the candidate vectors MMR needs
+        hits = chroma_retrieve(query, top_k=top_k, where=where, mmr_lambda=mmr_lambda)
+    else:
+        hits = search(_get_embedder()([query]), top_k=top_k)[0]
+
+    return _expand_hits(hits, context_size=context_size)
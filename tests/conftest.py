@@ -1,7 +1,7 @@
 import pytest
 
 from flask_quorial import create_app
-from flask_quorial import db
+from flask_quorial import db, rag_cache
 
 
 @pytest.fixture
@@ -12,9 +12,13 @@ def app(tmp_path):
     app = create_app({
         "TESTING": True,
         "DATABASE": str(test_db),
+        "PDF_CACHE_DIR": str(tmp_path / "pdf_cache"),
     })
 
     with app.app_context():
         db.init_db()
 
+    # Answers cached in-process must not leak between tests
+    rag_cache.clear()
+
     yield app
@@ -0,0 +1,291 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from io import BytesIO
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+from flask.testing import FlaskClient
+
+from flask_quorial.chat import _trivial_response
+from flask_quorial.db import get_db
+
+
+def login(client: FlaskClient) -> None:
+    client.post("/auth/login", data={"username": "1234", "password": "Go4one!"})
+
+
+def create_session(client: FlaskClient) -> int:
+    response = client.post("/chat/session", json={"title": "Test chat"})
+    return response.get_json()["session_id"]
+
+
+def send_message(client: FlaskClient, session_id: int, message: str) -> str:
+    """Post a message and wait for its background answer."""
+    response = client.post(f"/chat/session/{session_id}/message", json={"message": message})
+    assert response.status_code == 202
+    answer_id = response.get_json()["assistant_id"]
+    body = client.get(f"/chat/session/{session_id}/message/{answer_id}/stream").get_data(as_text=True)
+    events = [json.loads(line[6:]) for line in body.split("\n\n") if line.startswith("data: ")]
+    return events[0]["text"]
+
+
+def test_stream_message(client: FlaskClient, monkeypatch) -> None:
+    monkeypatch.setenv("MISTRAL_API_KEY", "test-key")
+    login(client)
+    session_id = create_session(client)
+    rag_result = {"answer": iter(["Hello ", "world"]), "sources": [{"title": "A"}]}
+    pipeline = MagicMock(return_value=rag_result)
+
+    with patch("flask_quorial.chat._get_pipeline", return_value=pipeline):
+        response = client.post(
+            f"/chat/session/{session_id}/message/stream",
+            json={"message": "What is new in Europe?"},
+        )
+        body = response.get_data(as_text=True)
+
+    assert response.mimetype == "text/event-stream"
+    events = [json.loads(line[6:]) for line in body.split("\n\n") if line.startswith("data: ")]
+    assert [e["text"] for e in events if "text" in e] == ["Hello ", "world"]
+    assert events[-1]["done"] is True
+    assert events[-1]["session_title"] == "What is new in Europe?"
+
+    page = client.get(f"/chat/session/{session_id}").get_json()
+    assert page["messages"] == ["What is new in Europe?", "Hello world"]
+    assert page["is_user"] == [True, False]
+    assert page["ids"][1] == events[-1]["assistant_id"]
+
+
+def test_stream_message_disconnect_keeps_question(client: FlaskClient, monkeypatch) -> None:
+    monkeypatch.setenv("MISTRAL_API_KEY", "test-key")
+    login(client)
+    session_id = create_session(client)
+    rag_result = {"answer": iter(["Hello ", "world"]), "sources": []}
+
+    with patch("flask_quorial.chat._get_pipeline", return_value=MagicMock(return_value=rag_result)):
+        response = client.post(
+            f"/chat/session/{session_id}/message/stream",
+            json={"message": "Question"},
+            buffered=False,
+        )
+        assert next(response.response).startswith(b"data: ")
+        response.close()  # the browser went away mid-answer
+
+    page = client.get(f"/chat/session/{session_id}").get_json()
+    assert page["messages"] == ["Question", "Sorry, there was an error processing your message."]
+    assert page["statuses"] == ["done", "error"]
+
+
+def test_repeated_question_is_cached(client: FlaskClient, monkeypatch) -> None:
+    monkeypatch.setenv("MISTRAL_API_KEY", "test-key")
+    login(client)
+    session_id = create_session(client)
+    pipeline = MagicMock(return_value={"answer": "Cached answer", "sources": []})
+
+    with patch("flask_quorial.chat._get_pipeline", return_value=pipeline):
+        for message in ("What is new?", "  what IS   new? "):
+            assert send_message(client, session_id, message) == "Cached answer"
+
+    assert pipeline.call_count == 1
+
+
+def test_small_talk_skips_pipeline(client: FlaskClient) -> None:
+    login(client)
+    session_id = create_session(client)
+    pipeline = MagicMock()
+
+    with patch("flask_quorial.chat._get_pipeline", return_value=pipeline):
+        assert send_message(client, session_id, "Thanks!").startswith("You're welcome")
+
+    pipeline.assert_not_called()
+
+
+def test_trivial_response_intents() -> None:
+    assert _trivial_response("Hello!").startswith("Hi!")
+    assert _trivial_response("ok").startswith("Great!")
+    assert _trivial_response("?").startswith("Hi!")
+    # A single letter or digit may be a real (if terse) question
+    assert _trivial_response("7") is None
+    assert _trivial_response("What is new?") is None
+
+
+def test_send_message_can_wait_for_the_answer(client: FlaskClient, monkeypatch) -> None:
+    monkeypatch.setenv("MISTRAL_API_KEY", "test-key")
+    login(client)
+    session_id = create_session(client)
+    pipeline = MagicMock(return_value={"answer": "Answer", "sources": [{"title": "A"}]})
+
+    with patch("flask_quorial.chat._get_pipeline", return_value=pipeline):
+        response = client.post(f"/chat/session/{session_id}/message", json={"message": "Question", "wait": True})
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["ai_response"] == "Answer"
+    assert data["sources"] == [{"title": "A"}]
+    assert data["session_title"] == "Question"
+
+
+def test_stream_answer_waits_without_polling(client: FlaskClient, monkeypatch) -> None:
+    monkeypatch.setenv("MISTRAL_API_KEY", "test-key")
+    login(client)
+    session_id = create_session(client)
+    sleep = time.sleep
+
+    def slow_pipeline(**_kwargs):
+        sleep(0.2)
+        return {"answer": "Slow answer", "sources": []}
+
+    def no_polling(_seconds):
+        raise AssertionError("stream_answer polled the database")
+
+    with patch("flask_quorial.chat._get_pipeline", return_value=slow_pipeline), \
+            patch("flask_quorial.chat.time.sleep", no_polling):
+        assert send_message(client, session_id, "Question") == "Slow answer"
+
+
+def test_failed_answer_is_marked_error(client: FlaskClient) -> None:
+    login(client)
+    session_id = create_session(client)
+
+    with patch("flask_quorial.chat.generate_rag_response", side_effect=RuntimeError("boom")):
+        response = client.post(f"/chat/session/{session_id}/message", json={"message": "Question"})
+        answer_id = response.get_json()["assistant_id"]
+        body = client.get(f"/chat/session/{session_id}/message/{answer_id}/stream").get_data(as_text=True)
+
+    events = [json.loads(line[6:]) for line in body.split("\n\n") if line.startswith("data: ")]
+    assert events == [{"error": "Sorry, there was an error processing your message."}]
+    assert client.get(f"/chat/session/{session_id}").get_json()["statuses"] == ["done", "error"]
+
+
+def test_get_session_pages(client: FlaskClient, monkeypatch) -> None:
+    monkeypatch.setenv("MISTRAL_API_KEY", "test-key")
+    login(client)
+    session_id = create_session(client)
+    pipeline = MagicMock(return_value={"answer": "Answer", "sources": []})
+
+    with patch("flask_quorial.chat._get_pipeline", return_value=pipeline):
+        for i in range(3):
+            send_message(client, session_id, f"Question {i}")
+
+    # Without a cursor the newest page comes first; older pages follow prev_cursor
+    latest = client.get(f"/chat/session/{session_id}?limit=4").get_json()
+    assert latest["messages"] == ["Question 1", "Answer", "Question 2", "Answer"]
+
+    older = client.get(f"/chat/session/{session_id}?limit=4&before_id={latest['prev_cursor']}").get_json()
+    assert older["messages"] == ["Question 0", "Answer"]
+    assert older["prev_cursor"] is None
+
+    first = client.get(f"/chat/session/{session_id}?limit=4&after_id=0").get_json()
+    assert first["messages"] == ["Question 0", "Answer", "Question 1", "Answer"]
+
+    rest = client.get(f"/chat/session/{session_id}?limit=4&after_id={first['next_cursor']}").get_json()
+    assert rest["messages"] == ["Question 2", "Answer"]
+    assert rest["next_cursor"] is None
+
+
+def test_stream_message_empty(client: FlaskClient) -> None:
+    login(client)
+    session_id = create_session(client)
+
+    response = client.post(f"/chat/session/{session_id}/message/stream", json={"message": "  "})
+    assert response.status_code == 400
+
+
+def test_export_session_pdf(app, client: FlaskClient, monkeypatch) -> None:
+    monkeypatch.setenv("MISTRAL_API_KEY", "test-key")
+    login(client)
+    session_id = create_session(client)
+    rag_result = {"answer": iter(["An <answer> & more"]), "sources": []}
+    pipeline = MagicMock(return_value=rag_result)
+
+    with patch("flask_quorial.chat._get_pipeline", return_value=pipeline):
+        client.post(f"/chat/session/{session_id}/message/stream", json={"message": "Hi there"}).get_data()
+
+    response = client.get(f"/chat/session/{session_id}/export")
+    assert response.status_code == 200
+    assert response.mimetype == "application/pdf"
+    assert response.get_data().startswith(b"%PDF")
+
+    # The unchanged session is served from the PDF cache
+    cache_dir = Path(app.config["PDF_CACHE_DIR"])
+    assert len(list(cache_dir.glob(f"chat-{session_id}-*.pdf"))) == 1
+    assert client.get(f"/chat/session/{session_id}/export").get_data() == response.get_data()
+
+    # A new exchange in the same second as the export is not served from the stale render
+    with patch("flask_quorial.chat._get_pipeline", return_value=MagicMock(return_value=rag_result)):
+        client.post(f"/chat/session/{session_id}/message/stream", json={"message": "Again"}).get_data()
+    assert client.get(f"/chat/session/{session_id}/export").get_data() != response.get_data()
+
+    # Deleting the session removes its cached renders
+    client.delete(f"/chat/session/{session_id}/delete")
+    assert not list(cache_dir.glob(f"chat-{session_id}-*.pdf"))
+
+
+def test_parallel_pdf_export_matches_single_pass(app, client: FlaskClient, monkeypatch, tmp_path) -> None:
+    pypdf = pytest.importorskip("pypdf")
+    from flask_quorial import chat
+
+    login(client)
+    session_id = create_session(client)
+    with app.app_context():
+        db = get_db()
+        # Answers of up to two pages, so most parts would end part-way down a page
+        db.executemany(
+            "INSERT INTO chat_messages (session_id, message, is_user) VALUES (?, ?, ?)",
+            [(session_id, f"Question {i}" if i % 2 == 0 else " ".join(["answer"] * 90 * (i % 9)), i % 2 == 0)
+             for i in range(23)],
+        )
+        db.commit()
+    monkeypatch.setattr(chat, "PDF_PART_SIZE", 5)
+
+    def export(parallel_threshold):
+        monkeypatch.setattr(chat, "PDF_PARALLEL_THRESHOLD", parallel_threshold)
+        # A separate file cache per mode, so the second export is rendered again
+        app.config["PDF_CACHE_DIR"] = str(tmp_path / f"pdf-{parallel_threshold}")
+        pdf = pypdf.PdfReader(BytesIO(client.get(f"/chat/session/{session_id}/export").get_data()))
+        return [page.extract_text() for page in pdf.pages]
+
+    monkeypatch.setattr(chat, "PDF_MAX_WORKERS", 2)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        monkeypatch.setattr(chat, "_get_pdf_pool", lambda: pool)
+        stitched = export(0)
+    single_pass = export(1000)
+
+    assert len(stitched) == len(single_pass)
+    assert stitched == single_pass
+
+
+def test_sessions_use_http_dates(client: FlaskClient) -> None:
+    login(client)
+    create_session(client)
+
+    session = client.get("/chat/sessions").get_json()[0]
+    # Same format as Flask's default provider, whether or not orjson is installed
+    assert session["created_at"].endswith(" GMT")
+    assert parsedate_to_datetime(session["created_at"]) is not None
+
+
+def test_rename_session_validation(client: FlaskClient) -> None:
+    login(client)
+    session_id = create_session(client)
+
+    assert client.put(f"/chat/session/{session_id}/rename", data="not json").status_code == 400
+    assert client.put(f"/chat/session/{session_id}/rename", json={"title": "x" * 201}).status_code == 400
+    assert client.put("/chat/session/9999/rename", json={"title": "Renamed"}).status_code == 404
+
+    response = client.put(f"/chat/session/{session_id}/rename", json={"title": " Renamed "})
+    assert response.get_json() == {"success": True, "title": "Renamed"}
+
+
+def test_delete_session(client: FlaskClient) -> None:
+    login(client)
+    session_id = create_session(client)
+
+    assert client.get(f"/chat/session/{session_id}").get_json() == {
+        "ids": [], "messages": [], "is_user": [], "statuses": [], "timestamps": [], "prev_cursor": None,
+    }
+    assert client.delete(f"/chat/session/{session_id}/delete").get_json() == {"success": True}
+    assert client.delete(f"/chat/session/{session_id}/delete").status_code == 404
+    assert client.get(f"/chat/session/{session_id}").status_code == 404
@@ -0,0 +1,81 @@
+import shutil
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from src.clean_raw_data import LANGUAGE_PAIRS, _uid_sides, delete_pairwise_duplicates
+
+
+def frame(rows):
+    return pd.DataFrame(rows, columns=['contentItemUid', 'languageCode', 'contentUrl'])
+
+
+# clean_data reads languageCode as a categorical
+@pytest.mark.parametrize('dtype', [object, 'category'])
+def test_ru_row_wins_over_en_and_de(dtype) -> None:
+    df = frame([
+        ('a', 'en', 'a-en'), ('a', 'ru', 'a-ru'),
+        ('b', 'de', 'b-de'), ('b', 'ru', 'b-ru'),
+        ('c', 'en', 'c-en'), ('c', 'de', 'c-de'), ('c', 'ru', 'c-ru'),
+    ]).astype({'languageCode': dtype})
+
+    result = delete_pairwise_duplicates(df, LANGUAGE_PAIRS)
+
+    assert result['contentUrl'].tolist() == ['a-ru', 'b-ru', 'c-ru']
+
+
+def test_en_de_duplicates_are_split_by_id_hash() -> None:
+    uids = [f'id-{i}' for i in range(200)]
+    df = frame([(uid, lang, f'{uid}-{lang}') for uid in uids for lang in ('en', 'de')])
+
+    result = delete_pairwise_duplicates(df, LANGUAGE_PAIRS)
+
+    # One row per id, and the side each id lands on is stable
+    assert result['contentItemUid'].tolist() == uids
+    sides = _uid_sides(pd.Index(uids))
+    expected = ['en' if side == 0 else 'de' for side in sides]
+    assert result['languageCode'].tolist() == expected
+    assert 0 < expected.count('en') < len(uids)
+
+
+def test_single_language_and_missing_ids_are_kept() -> None:
+    df = frame([
+        ('a', 'en', 'a-en'),
+        ('b', 'de', 'b-de'),
+        (None, 'en', 'none-en'),
+        (None, 'ru', 'none-ru'),
+    ])
+
+    result = delete_pairwise_duplicates(df, LANGUAGE_PAIRS)
+
+    assert result['contentUrl'].tolist() == ['a-en', 'b-de', 'none-en', 'none-ru']
+
+
+# Real articles: multi-line HTML inside quoted cells
+CLEANED_CSV = Path(__file__).resolve().parents[1] / 'data' / 'cleaned' / 'voxeurop_content_cleaned_v6.csv'
+
+
+@pytest.mark.parametrize('engine', ['polars', 'pandas', 'pandas-without-pyarrow'])
+def test_clean_data_engines_agree(engine, tmp_path, monkeypatch) -> None:
+    from src import clean_raw_data
+
+    if engine == 'polars':
+        pytest.importorskip('polars')
+    else:
+        monkeypatch.setattr(clean_raw_data, 'pl', None)
+    if engine == 'pandas-without-pyarrow':
+        monkeypatch.setattr(clean_raw_data, 'pa', None)
+    path = tmp_path / 'raw.csv'
+    shutil.copy(CLEANED_CSV, path)
+
+    result = clean_raw_data.clean_data(str(path))
+
+    # The file is already clean, so every row survives a second pass unchanged
+    expected = pd.read_csv(CLEANED_CSV)
+    assert expected['content'].str.contains('\n').sum() > 1000
+    pd.testing.assert_frame_equal(
+        result.astype({'languageCode': str}).reset_index(drop=True),
+        expected,
+        check_dtype=False,
+    )
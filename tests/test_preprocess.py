@@ -0,0 +1,68 @@
+import pandas as pd
+import pytest
+
+from src import preprocess
+from src.preprocess import _clean_simple_fragment, clean_html_fragment
+
+
+def parsed(text: str) -> str:
+    """clean_html_fragment with the regex fast path switched off."""
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(preprocess, "_clean_simple_fragment", lambda _text: None)
+        return clean_html_fragment(text)
+
+
+@pytest.mark.parametrize("text", [
+    "<p>One</p><p>Two</p>",
+    "<p class='lead'>  Spaced&nbsp;out  </p>\n<p>Tom &amp; Jerry &lt;3</p>",
+    "<p>A <a href=\"https://example.com\">link</a> and <b>bold</b> text</p>",
+    "<P>Upper case</P ><p></p><p>Last</p>",
+    "<div><p>Inside a div</p></div><span>dropped</span>",
+])
+def test_fast_path_matches_parser(text: str) -> None:
+    assert _clean_simple_fragment(text) is not None
+    assert clean_html_fragment(text) == parsed(text)
+
+
+@pytest.mark.parametrize("text", [
+    "<p><a href='x>y'>link</a></p>",
+    "<p><img alt=\"a > b\">caption</p>",
+    "<p>Before<!-- hidden --> after</p>",
+    "<p>Code</p><script>var p = '<p>';</script>",
+    "<p>1 < 2</p>",
+    "<p>Unclosed<p>paragraphs",
+    "<p>Outer <p>nested</p></p>",
+])
+def test_markup_needing_a_parser_is_left_to_it(text: str) -> None:
+    assert _clean_simple_fragment(text) is None
+    assert clean_html_fragment(text) == parsed(text)
+
+
+def test_quoted_gt_in_attribute() -> None:
+    assert clean_html_fragment("<p><a href='x>y'>link</a></p>") == "link"
+
+
+def test_plain_text_is_kept() -> None:
+    assert clean_html_fragment("  Fish &amp; chips\xa0daily ") == "Fish & chips daily"
+    assert clean_html_fragment(None) == ""
+
+
+def test_duplicate_ids_keep_first_position_and_last_values(tmp_path) -> None:
+    raw = tmp_path / "raw.csv"
+    pd.DataFrame({
+        "contentItemUid": ["a", "b", "a", "c"],
+        "title": ["A old", "B", "A new", "C"],
+        "content": ["<p>old</p>", "<p>b</p>", "<p>new</p>", "<p>c</p>"],
+        "summary": ["s", None, "s2", "s3"],
+    }).to_csv(raw, index=False)
+    out = tmp_path / "out.json"
+
+    result = preprocess.extract_title_and_content(str(raw), str(out))
+
+    assert result.index.tolist() == ["a", "b", "c"]
+    records = pd.read_json(out, lines=True)
+    assert records.to_dict("records") == [
+        {"title": "A new", "content": "new", "summary": "s2"},
+        {"title": "B", "content": "b", "summary": ""},
+        {"title": "C", "content": "c", "summary": "s3"},
+    ]
@@ -0,0 +1,50 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from flask_quorial import rag_cache
+
+
+@pytest.fixture
+def semantic(monkeypatch):
+    """Enable the semantic tier with an embedder that maps every question to one vector."""
+    calls = []
+
+    def embed(normalized):
+        calls.append(normalized)
+        return np.array([1.0, 0.0], dtype=np.float32)
+
+    monkeypatch.setattr(rag_cache, "SEMANTIC_CACHE_ENABLED", True)
+    monkeypatch.setattr(rag_cache, "_embed_cached", embed)
+    return calls
+
+
+def test_semantic_tier_is_off_by_default() -> None:
+    rag_cache.put("m", "What did France decide in 2019?", {"answer": "a"})
+
+    assert rag_cache.get_cached_answer("m", "what did  France decide in 2019 ?") is None
+    assert rag_cache.get_cached_answer("m", "What did France decide in 2019?") == {"answer": "a"}
+
+
+def test_near_misses_with_other_entities_do_not_collide(semantic) -> None:
+    rag_cache.put("m", "What did France decide in 2019?", {"answer": "france-2019"})
+
+    # Identical embeddings, but another year or country is a different question
+    assert rag_cache.get_cached_answer("m", "What did France decide in 2020?") is None
+    assert rag_cache.get_cached_answer("m", "What did Spain decide in 2019?") is None
+    assert rag_cache.get_cached_answer("m", "What was decided by France in 2019?") == {"answer": "france-2019"}
+    # Each model keeps its own answers
+    assert rag_cache.get_cached_answer("other", "What was decided by France in 2019?") is None
+
+
+def test_embedder_failure_is_latched(semantic, monkeypatch) -> None:
+    def broken(normalized):
+        semantic.append(normalized)
+        raise RuntimeError("model download failed")
+
+    monkeypatch.setattr(rag_cache, "_embed_cached", broken)
+
+    rag_cache.put("m", "First question", {"answer": "a"})
+    assert rag_cache.get_cached_answer("m", "Second question") is None
+    assert rag_cache.get_cached_answer("m", "First question") == {"answer": "a"}
+    assert semantic == ["first question"]
@@ -0,0 +1,55 @@
+import pytest
+
+for module in ("chromadb", "dotenv", "openai", "mistralai"):
+    pytest.importorskip(module)
+
+from src.rag_pipeline import _budget_contents, _build_context, _select_sources, _source_infos
+
+
+def source(title, content, summary=None):
+    return {"title": title, "summary": summary, "combined_content": content, "score": 0.5}
+
+
+def test_budgets_cut_each_source_and_the_total() -> None:
+    sources = [source("A", "a" * 30), source("B", " " + "b" * 30 + " "), source("C", "c" * 30)]
+
+    contents = _budget_contents(sources, max_source_chars=20, max_context_chars=35)
+
+    # 20 for A (per-source cap), the remaining 15 for B, nothing left for C
+    assert contents == ["a" * 20, "b" * 15, None]
+
+
+def test_context_stops_at_the_first_dropped_source() -> None:
+    sources = [source("A", "alpha", summary="About A"), source("B", "beta"), source("C", "gamma")]
+
+    context = _build_context(sources, ["alpha", "be", None])
+
+    assert context == (
+        "[Source 1] A\nSummary: About A\n\nalpha"
+        "\n\n---\n\n"
+        "[Source 2] B\n\nbe"
+    )
+    assert _build_context(sources) == _build_context(sources, ["alpha", "beta", "gamma"])
+
+
+def test_source_infos_flag_budgeted_sources() -> None:
+    sources = [source("A", "alpha"), source("B", "beta"), source("C", "gamma")]
+
+    infos = _source_infos(sources, ["alpha", "be", None])
+
+    assert [(i["in_context"], i["truncated"]) for i in infos] == [
+        (True, False), (True, True), (False, True),
+    ]
+    assert infos[0]["score"] == "50.0%"
+
+
+def test_select_sources_keeps_every_window_of_the_top_articles() -> None:
+    def window(article_id, primary, score):
+        return {"article_id": article_id, "primary_chunk_idx": primary, "score": score}
+
+    hits = [window("a", 3, 0.9), window("b", 1, 0.8), window("c", 0, 0.85),
+            window("a", 15, 0.7), window("a", 3, 0.6)]
+
+    selected = _select_sources(hits, max_articles=2)
+
+    assert [(h["article_id"], h["primary_chunk_idx"]) for h in selected] == [("a", 3), ("c", 0), ("a", 15)]
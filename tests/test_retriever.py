@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("chromadb")
+
+from src import retriever
+from src.retriever import _expand_hits, _mmr
+
+
+def article(article_id, n_chunks):
+    return [
+        {
+            "id": f"{article_id}:{idx}",
+            "text": f"{article_id}-{idx}",
+            "metadata": {"article_id": article_id, "chunk_idx": idx, "title": article_id},
+            "chunk_idx": idx,
+        }
+        for idx in range(n_chunks)
+    ]
+
+
+def hit(article_id, chunk_idx, score):
+    return {
+        "id": f"{article_id}:{chunk_idx}",
+        "metadata": {"article_id": article_id, "chunk_idx": chunk_idx},
+        "score": score,
+    }
+
+
+@pytest.fixture
+def chunks(monkeypatch):
+    articles = {"a": article("a", 20), "b": article("b", 5)}
+    monkeypatch.setattr(
+        retriever, "_fetch_many_article_chunks",
+        lambda ids: {aid: articles[aid] for aid in ids},
+    )
+    return articles
+
+
+def test_hits_of_one_article_merge_into_one_window(chunks) -> None:
+    hits = [hit("a", 7, 0.9), hit("b", 0, 0.8), hit("a", 3, 0.5)]
+
+    expanded = _expand_hits(hits, context_size=2)
+
+    assert [r["article_id"] for r in expanded] == ["a", "b"]
+    a, b = expanded
+    # 7 is the primary; 3 (window 1-5) touches 5-9 and is merged
+    assert a["primary_chunk_idx"] == 7
+    assert a["score"] == 0.9
+    assert [c["chunk_idx"] for c in a["chunk_details"]] == list(range(1, 10))
+    assert [c["chunk_idx"] for c in a["chunk_details"] if c["is_primary"]] == [7]
+    assert a["combined_content"] == "\n\n".join(f"a-{idx}" for idx in range(1, 10))
+    # The window is clipped to the chunks the article has
+    assert [c["chunk_idx"] for c in b["chunk_details"]] == [0, 1, 2]
+
+
+def test_distant_hits_of_one_article_stay_separate(chunks) -> None:
+    hits = [hit("a", 3, 0.9), hit("b", 2, 0.8), hit("a", 15, 0.7), hit("a", 4, 0.6)]
+
+    expanded = _expand_hits(hits, context_size=2)
+
+    # 3 and 4 share a window; 15 (13-17) does not touch 1-6, so it is its own record
+    assert [(r["article_id"], r["primary_chunk_idx"]) for r in expanded] == [("a", 3), ("b", 2), ("a", 15)]
+    assert [c["chunk_idx"] for c in expanded[0]["chunk_details"]] == list(range(1, 7))
+    assert [c["chunk_idx"] for c in expanded[2]["chunk_details"]] == list(range(13, 18))
+    assert expanded[2]["score"] == 0.7
+
+
+def test_chain_of_adjacent_hits_is_absorbed(chunks) -> None:
+    hits = [hit("a", 10, 0.9), hit("a", 14, 0.5), hit("a", 18, 0.4)]
+
+    # Windows 9-11, 13-15 and 17-19 leave gaps, so each hit keeps its own record
+    spans = _expand_hits(hits, context_size=1)
+    assert [[c["chunk_idx"] for c in r["chunk_details"]] for r in spans] == [
+        [9, 10, 11], [13, 14, 15], [17, 18, 19],
+    ]
+
+    # Windows 8-12, 12-16 and 16-20 overlap in a chain, clipped to the last chunk
+    (a,) = _expand_hits(hits, context_size=2)
+    assert [c["chunk_idx"] for c in a["chunk_details"]] == list(range(8, 20))
+
+
+def test_mmr_prefers_diverse_candidates() -> None:
+    vecs = np.array([[1.0, 0.0], [1.0, 0.0], [0.0, 1.0]], dtype=np.float32)
+    query_sims = np.array([0.9, 0.89, 0.5], dtype=np.float32)
+
+    # Pure relevance keeps the score order; a diversity weight skips the near-copy
+    assert _mmr(query_sims, vecs, 2, lambda_mult=1.0) == [0, 1]
+    assert _mmr(query_sims, vecs, 2, lambda_mult=0.5) == [0, 2]
+    assert _mmr(query_sims, vecs, 5, lambda_mult=0.5) == [0, 2, 1]
+    assert _mmr(query_sims[:0], vecs[:0], 3) == []
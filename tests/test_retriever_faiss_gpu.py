@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("chromadb")
+pytest.importorskip("faiss")
+
+from src import retriever_faiss_gpu
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    """In-memory stand-in for the Chroma collection, with orthogonal embeddings."""
+    rows = {"vectors": list(np.eye(64, dtype=np.float32)[:40]), "builds": 0}
+
+    def call(method, **kwargs):
+        if method == "count":
+            return len(rows["vectors"])
+        if kwargs["offset"] == 0:
+            rows["builds"] += 1
+        page = range(kwargs["offset"], min(len(rows["vectors"]), kwargs["offset"] + kwargs["limit"]))
+        return {
+            "ids": [str(i) for i in page],
+            "documents": [f"doc {i}" for i in page],
+            "metadatas": [{"chunk_idx": i} for i in page],
+            "embeddings": [rows["vectors"][i] for i in page],
+        }
+
+    monkeypatch.setattr(retriever_faiss_gpu, "_collection_call", call)
+    monkeypatch.setattr(retriever_faiss_gpu, "_clear_chroma_cache", lambda: None)
+    retriever_faiss_gpu.clear_cache()
+    yield rows
+    retriever_faiss_gpu.clear_cache()
+
+
+def test_index_follows_the_collection(collection, monkeypatch) -> None:
+    def top_id(i):
+        (hits,) = retriever_faiss_gpu.search([np.eye(64)[i]], top_k=1)
+        return hits[0]["id"] if hits else None
+
+    assert top_id(3) == "3"
+    assert top_id(3) == "3"
+    assert collection["builds"] == 1
+
+    # Re-ingested with more chunks: picked up once the count is re-read
+    collection["vectors"] = list(np.eye(64, dtype=np.float32)[:50])
+    assert top_id(45) != "45"
+    monkeypatch.setattr(retriever_faiss_gpu, "INDEX_CHECK_INTERVAL", 0)
+    assert top_id(45) == "45"
+    assert collection["builds"] == 2
+
+    # Same size, new content: only clear_cache notices
+    collection["vectors"] = collection["vectors"][::-1]
+    assert top_id(45) == "45"
+    retriever_faiss_gpu.clear_cache()
+    assert top_id(45) == "4"
+    assert collection["builds"] == 3